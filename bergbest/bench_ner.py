@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Compare the NER loading of bergbest (BookNE): single streaming pass
+   per NER file against parsing it once for mountains and once for
+   persons. Reports load time per year (1957-2011 by default) and in
+   total."""
+
+from os import sys
+from time import time
+
+import bergbest
+from bergbest import BookNE
+
+# Times each year is loaded per mode (the fastest one counts)
+REPEATS = 3
+
+def named_entities(book_ne):
+    """Return the NEs of a book as comparable values."""
+    return ([(mountain.stid, mountain.location) for mountain
+             in book_ne.mountains_de + book_ne.mountains_fr],
+            [(person.pid, person.firstname, person.lastname,
+              person.locations) for person
+             in book_ne.persons_de + book_ne.persons_fr])
+
+def load(year, streaming):
+    """Return the book's NEs and the seconds of the fastest load."""
+    seconds = []
+    for repeat in range(REPEATS):
+        start_time = time()
+        book_ne = BookNE(year, streaming)
+        seconds.append(time() - start_time)
+    return named_entities(book_ne), min(seconds)
+
+def main():
+
+    year_range = bergbest.YEAR_RANGE
+    if len(sys.argv) > 1:
+        years = [int(year) for year in sys.argv[1].split('-')]
+        year_range = range(years[0], years[-1] + 1)
+
+    print('%-6s %10s %10s %10s %8s' % ('year', 'mountains', 'two-pass',
+                                       'streaming', 'speedup'))
+    totals = {False : 0.0, True : 0.0}
+    for year in year_range:
+        results = {}
+        try:
+            for streaming in (False, True):
+                results[streaming] = load(year, streaming)
+        except IOError:
+            print('Skip (inexistent) NER files of ' + str(year) + '.')
+            continue
+        for streaming in (False, True):
+            totals[streaming] += results[streaming][1]
+        if results[False][0] != results[True][0]:
+            print('NEs of ' + str(year) + ' differ between modes!')
+            sys.exit(1)
+
+        print('%-6s %10d %10.4f %10.4f %7.2fx' %
+              (year, len(results[True][0][0]), results[False][1],
+               results[True][1],
+               results[False][1] / max(results[True][1], 1e-9)))
+
+    print('%-6s %10s %10.4f %10.4f %7.2fx' %
+          ('total', '', totals[False], totals[True],
+           totals[False] / max(totals[True], 1e-9)))
+    print('Same NEs loaded by both modes.')
+
+if __name__ == '__main__':
+	main()
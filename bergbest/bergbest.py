@@ -2,10 +2,24 @@
 # -*- coding: utf-8 -*-
 # h2m@access.uzh.ch
 
+from contextlib import redirect_stdout
+from io import StringIO
+from json import dumps
 from lxml import etree
-from os import sep, sys
+from multiprocessing import Pool
+from os import sep, sys, pardir
+from os.path import abspath, basename, dirname, join
 from re import sub
-from sys import stdout
+
+import numpy as np
+
+# Columnar store of the year books, shared with tbta
+sys.path.append(join(dirname(abspath(__file__)), pardir, 'tbstore'))
+import tbstore
+
+# Profiling of stages, shared with tbta
+sys.path.append(join(dirname(abspath(__file__)), pardir, 'tbprofile'))
+import tbprofile
 
 # Filename prefix
 FILENAME_PREFIX = "SAC-Jahrbuch_"
@@ -44,6 +58,45 @@ CANDID_LEMMATA_FR = [
                      #'arriver'
                      ]
 
+# PoS tag prefixes of verbs for DE and FR
+VERB_POS_PREFIXES_DE = ['VV']
+VERB_POS_PREFIXES_FR = ['V']
+
+# Roles of words matched (see LemmaMatcher)
+CANDIDATE_ROLE = 'candidate'
+VERB_ROLE = 'verb'
+
+# Separator of ambiguous lemmata (e. g. 'gelangen|gelingen')
+LEMMA_SEPARATOR = '|'
+
+# Options to process the years given (--years from_year[-to_year]) and
+# to process years in a pool of processes (--jobs N)
+YEARS_OPTION = '--years'
+JOBS_OPTION = '--jobs'
+
+# Option to write candidate facts to a file (--facts FILE), as TSV for
+# files ending in .tsv and as JSON lines otherwise
+FACTS_OPTION = '--facts'
+TSV_SUFFIX = '.tsv'
+
+# Fields of a candidate fact (in the order written)
+FACT_FIELDS = ['year', 'pair_id', 'lang', 'sentence_id', 'mountain_stids',
+               'person_pids', 'verb_lemma', 'sentence']
+
+# Size (in bytes) of the buffer of the facts file
+FACTS_BUFFER_SIZE = 1024 * 1024
+
+# Option to leave out the debug output (articles, sentences with NEs,
+# verbs, candidate sentences) on stdout (--quiet)
+QUIET_OPTION = '--quiet'
+
+# Print debug output (see QUIET_OPTION)
+PRINT_DEBUG = True
+
+# Option to read candidate lemmata and verb PoS prefixes from a file 
+# instead (--matcher FILE, see load_matchers())
+MATCHER_OPTION = '--matcher'
+
 # NER filename substring, which indicates NER contents of an XML file.
 NER_SUBSTR = '-ner'
 
@@ -54,9 +107,166 @@ SAC_XML_DIR = 'Text+Berg_Release_147_v03' + sep + 'XML' + sep \
 # Range of documents to check
 YEAR_RANGE = range(1957, 2012) # 1957-2011
 
+# Read year books from the columnar store (see tbstore), where both books
+# of a year are converted (also by --store)
+USE_STORE = False
+STORE_OPTION = '--store'
+
+# Read each NER file in a single streaming pass (lxml iterparse) instead
+# of parsing it once for mountains and once for persons
+STREAMING_NER = True
+
+# Folder of the columnar store
+STORE_DIR = tbstore.STORE_DIR
+
+# Option to write wall time, CPU time, peak memory and throughput of the
+# stages to a JSON file (--profile FILE)
+PROFILE_OPTION = '--profile'
+
+# Mountains and persons of a sentence without NEs (see BookNE)
+NO_ENTITIES = ((), ())
+
 # Name for an empty title
 EMPTY_TITLE = "NONE"
 
+def debug(*args):
+    """Print debug output (unless turned off by --quiet)."""
+    if PRINT_DEBUG:
+        print(*args)
+
+class FactWriter:
+    """Buffered writer of candidate facts, one record per line: JSON
+       lines or TSV (with a header line; ids are separated by commas)."""
+    
+    def __init__(self, filepath):
+        self.tsv = filepath.endswith(TSV_SUFFIX)
+        self.number_of_facts = 0
+        self._filehdl = open(filepath, 'w', encoding='utf-8', 
+                             buffering=FACTS_BUFFER_SIZE)
+        if self.tsv:
+            self._filehdl.write('\t'.join(FACT_FIELDS) + '\n')
+    
+    def write(self, fact):
+        """Write a fact (dict of FACT_FIELDS)."""
+        if self.tsv:
+            fields = []
+            for field in FACT_FIELDS:
+                value = fact[field]
+                if isinstance(value, list):
+                    value = ','.join(value)
+                fields.append(sub('[\t\n]', ' ', str(value)))
+            self._filehdl.write('\t'.join(fields) + '\n')
+        else:
+            self._filehdl.write(dumps(fact, ensure_ascii=False) + '\n')
+        self.number_of_facts += 1
+    
+    def close(self):
+        self._filehdl.close()
+
+class LemmaMatcher:
+    """Matcher of the words of a sentence against the candidate lemmata
+       and verb PoS tags of a language; built once per language. Roles
+       are looked up once per distinct lemma and PoS tag."""
+    
+    def __init__(self, candidate_lemmata, verb_pos_prefixes):
+        # Ambiguous lemmata given count by each of their alternatives
+        self.candidate_lemmata = frozenset(
+                                     alternative for lemma 
+                                     in candidate_lemmata for alternative 
+                                     in lemma.split(LEMMA_SEPARATOR))
+        self.verb_pos_prefixes = tuple(verb_pos_prefixes)
+        self._roles = {} # (lemma, PoS tag) -> roles
+    
+    def roles(self, lemma, pos):
+        """Return roles of a word: candidate, if (one alternative of) its
+           lemma is a candidate lemma, and verb, if its PoS tag is a verb
+           tag. Words without lemma have no role."""
+        key = (lemma, pos)
+        if key not in self._roles:
+            roles = []
+            if lemma is not None:
+                if self.is_candidate(lemma):
+                    roles.append(CANDIDATE_ROLE)
+                if pos is not None and self.is_verb(pos):
+                    roles.append(VERB_ROLE)
+            self._roles[key] = tuple(roles)
+        return self._roles[key]
+    
+    def is_candidate(self, lemma):
+        """Tell whether (one alternative of) a lemma is a candidate."""
+        return not self.candidate_lemmata.isdisjoint(
+                   lemma.split(LEMMA_SEPARATOR))
+    
+    def is_verb(self, pos):
+        """Tell whether a PoS tag is a verb tag."""
+        return pos.startswith(self.verb_pos_prefixes)
+    
+    def candidate_mask(self, lemmata):
+        """Return mask of the candidate lemmata of a book's vocabulary of
+           lemmata (see tbstore); the candidates are looked up in it at 
+           once, and only its ambiguous lemmata are decoded."""
+        mask = np.zeros(len(lemmata), dtype=bool)
+        indices = lemmata.indices(sorted(self.candidate_lemmata))
+        mask[indices[indices >= 0]] = True
+        separators = np.flatnonzero(lemmata.data == 
+                                    ord(LEMMA_SEPARATOR))
+        for index in np.unique(np.searchsorted(lemmata.offsets, 
+                                               separators, 
+                                               side='right') - 1).tolist():
+            mask[index] = self.is_candidate(lemmata[index])
+        return mask
+    
+    def verb_mask(self, pos_tags):
+        """Return mask of the verb tags of a book's vocabulary of PoS 
+           tags (see tbstore)."""
+        return np.array([self.is_verb(pos_tags[index]) for index 
+                         in range(len(pos_tags))], dtype=bool)
+    
+    def match(self, sentence):
+        """Return matches (word id, lemma, role) of a sentence's words, in
+           word order."""
+        matches = []
+        for word in sentence.iter('w'):
+            attrib = word.attrib
+            lemma = attrib.get('lemma')
+            for role in self.roles(lemma, attrib.get('pos')):
+                matches.append((attrib.get('n'), lemma, role))
+        return matches
+
+def load_matchers(filepath=None):
+    """Return matcher of each language, built from CANDID_LEMMATA_DE/FR
+       and VERB_POS_PREFIXES_DE/FR or from the file given. Each line of
+       the file holds language code, role and value, e. g. 
+       'de candidate besteigen' or 'fr verb V' (PoS tag prefix); lines
+       starting with # are comments."""
+    if filepath is None:
+        return {
+                DE_LANG : LemmaMatcher(CANDID_LEMMATA_DE, 
+                                       VERB_POS_PREFIXES_DE),
+                FR_LANG : LemmaMatcher(CANDID_LEMMATA_FR, 
+                                       VERB_POS_PREFIXES_FR)
+               }
+    
+    rules = {DE_LANG : ([], []), FR_LANG : ([], [])}
+    with open(filepath, encoding='utf-8') as filehdl:
+        for line_no, line in enumerate(filehdl, 1):
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) != 3 or \
+               fields[1] not in [CANDIDATE_ROLE, VERB_ROLE]:
+                raise ValueError(filepath + ':' + str(line_no) + 
+                                 ': expected <lang> candidate|verb ' +
+                                 '<value>')
+            lemmata, pos_prefixes = rules.setdefault(fields[0], ([], []))
+            if fields[1] == CANDIDATE_ROLE:
+                lemmata.append(fields[2])
+            else:
+                pos_prefixes.append(fields[2])
+    
+    return dict((lang, LemmaMatcher(lemmata, pos_prefixes)) for lang, 
+                (lemmata, pos_prefixes) in rules.items())
+
 class ArticlesHashed(dict):
     """Class to hold and get articles directly by id (hashed = faster).
     """
@@ -74,7 +284,8 @@ class ArticleTranslated:
     """Class to hold a (single) article pair; used for analysis of 
        candidate facts."""
     
-    def __init__(self, article_pair, yearbook, book_ne, pair_id):
+    def __init__(self, article_pair, yearbook, book_ne, pair_id,
+                 matchers=None):
         
         # Meta data
         self.yearbook = yearbook
@@ -88,10 +299,14 @@ class ArticleTranslated:
         
         # Effective data
         self.book_ne = book_ne
+        self.matchers = matchers
+        if self.matchers is None:
+            self.matchers = load_matchers()
         self.sentences_de = []
         self.sentences_fr = []
         self.candidate_sentences_de = []
         self.candidate_sentences_fr = []
+        self.facts = [] # Candidate facts (see FACT_FIELDS)
         self.mountain_dict_de = {}
         self.mountain_dict_fr = {}
 
@@ -105,95 +320,112 @@ class ArticleTranslated:
         self._create_candidate_sentences(FR_LANG)
     
     def _create_candidate_sentences(self, lang):
-        """Find sentences which contain NEs."""
+        """Find sentences which contain NEs (mountains and persons), by
+           the book's sentence index."""
+        candidate_sentences = []
+        
+        if lang == DE_LANG:
+            candidate_sentences = self.candidate_sentences_de
+        elif lang == FR_LANG:
+            candidate_sentences = self.candidate_sentences_fr
+        
+        mountain_sentences = []
+        person_sentences = []
+        mountain_and_person_sentences = []
+        for sentence, stids, pids in self._sentences_with_entities(lang):
+            sentence_no = sentence.attrib['n'].split('-')[1]
+            if stids:
+                mountain_sentences.append(sentence_no)
+            if pids:
+                person_sentences.append(sentence_no)
+            if stids and pids:
+                mountain_and_person_sentences.append(sentence_no)
+                candidate_sentences.append((sentence, stids, pids))
+        
+        if lang == DE_LANG:
+            self.candidate_sentences_de_number = len(candidate_sentences)
+        elif lang == FR_LANG:
+            self.candidate_sentences_fr_number = len(candidate_sentences)
+       
+        debug('Sentences with mountains (' + lang + '):', 
+              mountain_sentences)
+        debug('Sentences with persons (' + lang + '):', 
+              person_sentences)
+        debug('Sentences with both (' + lang + '):', 
+              mountain_and_person_sentences)
+        
+        matcher = self.matchers.get(lang)
+        if matcher is None:
+            return
+        for sentence, stids, pids in candidate_sentences:
+            for word_id, lemma, role in self._match(sentence, lang, 
+                                                    matcher):
+                if role == CANDIDATE_ROLE:
+                    debug("* * * * * CHECK " \
+                          + str(self.yearbook) + "#" \
+                          + str(self.pair_id) + " (" + lang + ")")
+                    self._print_match(stids, pids, lang)
+                    self._print_sentence(sentence, lang)
+                    self.facts.append(self._fact(sentence, stids, pids,
+                                                 lemma, lang))
+                elif role == VERB_ROLE:
+                    debug('VERB (' + lang + '): ' + lemma)
+    
+    def _sentences_with_entities(self, lang):
+        """Yield sentences of the language given which contain NEs, with
+           the stids of their mountains and the pids of their persons."""
         sentences = []
-        ne_tag = ''
-        mountains = None
-        persons = None
-        word_positions = []
-        mountain_positions = []
-        person_positions = []
+        sentence_index = self.book_ne.sentence_index(lang)
         
         if lang == DE_LANG:
             sentences = self.sentences_de
-            mountains = self.book_ne.mountains_de
-            persons = self.book_ne.persons_de
         elif lang == FR_LANG:
             sentences = self.sentences_fr
-            mountains = self.book_ne.mountains_fr
-            persons = self.book_ne.persons_fr
-            
-        for sentence in sentences:
-            # Get all words' positions
-            for word in sentence.xpath('./w'):
-                word_positions.append(word.attrib['n'])
-        
-        mountain_positions = self.book_ne.mountain_positions(lang)
-        person_positions = self.book_ne.person_positions(lang)
-
-        mountains_present = set(mountain_positions).\
-                            intersection(set(word_positions))
-        persons_present = set(person_positions).\
-                          intersection(set(word_positions))
-
-        mountain_sentences = [position.split('-')[1] for position in \
-                              mountains_present]
-        person_sentences = [position.split('-')[1] for position in \
-                            persons_present]
-        mountain_and_person_sentences = set(mountain_sentences).\
-                                        intersection(set(person_sentences))
-       
-        print('Sentences with mountains (' + lang + '):', 
-               mountain_sentences)
-        print('Sentences with persons (' + lang + '):', 
-               person_sentences)
-        print('Sentences with both (' + lang + '):', 
-               mountain_and_person_sentences)
         
         for sentence in sentences:
-            if sentence.attrib['n'].split('-')[1] in \
-            mountain_and_person_sentences:
-                for word in sentence.xpath('w'):
-                    try:
-                        if lang == DE_LANG:
-                            if word.attrib['lemma'] \
-                             in CANDID_LEMMATA_DE:
-                                print("* * * * * CHECK " \
-                                      + str(self.yearbook) + "#" \
-                                      + str(self.pair_id) + " (de)")
-                                self._print_sentence(sentence, lang)
-                        elif lang == FR_LANG:
-                            if word.attrib['lemma'] \
-                             in CANDID_LEMMATA_FR:
-                                print("* * * * * CHECK " \
-                                      + str(self.yearbook) + "#" \
-                                      + str(self.pair_id) + " (fr)")
-                                self._print_sentence(sentence, lang)
-                    except:
-                        pass
-                    try:
-                        if lang == DE_LANG:
-                            if word.attrib['pos'].startswith('VV'):
-                                #print('VERB (' + lang + '): ' + \
-                                # word.text)
-                                print('VERB (' + lang + '): ' + \
-                                      word.attrib['lemma'])
-
-                        elif lang == FR_LANG:
-                            if word.attrib['pos'].startswith('V'):
-                                #print('VERB: (' + lang + '): ' + \
-                                # word.text)
-                                print('VERB (' + lang + '): ' + \
-                                       word.attrib['lemma'])
-
-                    except:
-                        pass
+            stids, pids = sentence_index.get(sentence.attrib['n'], 
+                                             NO_ENTITIES)
+            if stids or pids:
+                yield (sentence, stids, pids)
+    
+    def _match(self, sentence, lang, matcher):
+        """Return matches of a sentence's words (see LemmaMatcher)."""
+        return matcher.match(sentence)
+    
+    def _sentence_words(self, sentence):
+        """Return texts of a sentence's words."""
+        return [word.text for word in sentence.findall('w')]
+    
+    def _sentence_text(self, sentence, lang):
+        """Return text of a sentence (its words separated by spaces)."""
+        return ' '.join(text or '' for text 
+                        in self._sentence_words(sentence))
+    
+    def _fact(self, sentence, stids, pids, lemma, lang):
+        """Return record of a candidate fact (see FACT_FIELDS)."""
+        return {
+                'year' : int(self.yearbook),
+                'pair_id' : self.pair_id,
+                'lang' : lang,
+                'sentence_id' : sentence.attrib['n'],
+                'mountain_stids' : list(stids),
+                'person_pids' : list(pids),
+                'verb_lemma' : lemma,
+                'sentence' : self._sentence_text(sentence, lang)
+               }
+    
+    def _print_match(self, stids, pids, lang):
+        """Prints the NEs matched in a sentence."""
+        debug('* * * MATCH (' + lang + '): mountains ' + ','.join(stids) +
+              ' | persons ' + ','.join(pids))
     
     def _print_sentence(self, sentence, lang):
         """Prints sentence as a whole."""
-        stdout.write('* * * SENTENCE (' + lang + '): ')
-        for word in sentence.xpath('w'):
-            stdout.write(word.text + " ")
+        if not PRINT_DEBUG:
+            return
+        sys.stdout.write('* * * SENTENCE (' + lang + '): ')
+        for text in self._sentence_words(sentence):
+            sys.stdout.write(text + " ")
         print('\n')
                                     
     def _read_title(self, article_pair):
@@ -203,9 +435,9 @@ class ArticleTranslated:
         
         # It may be that a title is not given.
         try:
-            self.article_title_de = article_de.xpath('./tocEntry')[0].\
+            self.article_title_de = article_de.find('tocEntry').\
                                     attrib['title']
-            self.article_title_fr = article_fr.xpath('./tocEntry')[0].\
+            self.article_title_fr = article_fr.find('tocEntry').\
                                     attrib['title']
         except:
             self.article_title_de = EMPTY_TITLE
@@ -217,8 +449,8 @@ class ArticleTranslated:
         article_de = article_pair[0]
         article_fr = article_pair[1]
         
-        self.sentences_de = article_de.xpath('.//s')
-        self.sentences_fr = article_fr.xpath('.//s')
+        self.sentences_de = list(article_de.iter('s'))
+        self.sentences_fr = list(article_fr.iter('s'))
         self.sentences_de_number = len(self.sentences_de)
         self.sentences_fr_number = len(self.sentences_fr)
         
@@ -238,34 +470,188 @@ class ArticleTranslated:
                   
         return ret_str
 
+class StoredScan:
+    """Candidate scan of a book in the store (see tbstore), done on its
+       columns at once: the sentences with NEs are looked up by their
+       ids, and the roles of the words in sentences with both mountains
+       and persons are found by their lemma and PoS ids. Only the words
+       matched are decoded."""
+    
+    def __init__(self, book, sentence_index, matcher=None):
+        self.book = book
+        self.sentence_indices = np.zeros(0, dtype=np.int64) # In order
+        self.entities = [] # Stids and pids of each sentence
+        self.matches = {} # Sentence index -> matches (see LemmaMatcher)
+        self.texts = {} # Sentence index -> text, if it has a candidate
+        
+        # Sentences with NEs (ids missing in the book are left out)
+        sentence_ids = list(sentence_index)
+        indices = book.sentence_n.indices(sentence_ids)
+        order = np.argsort(indices, kind='mergesort')
+        order = order[indices[order] >= 0]
+        self.sentence_indices = indices[order]
+        self.entities = [sentence_index[sentence_ids[position]] 
+                         for position in order.tolist()]
+        
+        if matcher is not None:
+            self._match_words(matcher)
+    
+    def _match_words(self, matcher):
+        """Set matches of the words of the sentences with both mountains
+           and persons, found by masks of the candidate lemmata and verb
+           PoS tags on the id columns; only the words matched are 
+           decoded."""
+        book = self.book
+        sentence_indices = self.sentence_indices[
+            [position for position, (stids, pids) 
+             in enumerate(self.entities) if stids and pids]]
+        starts = book.sentence_offsets[sentence_indices]
+        lengths = book.sentence_offsets[sentence_indices + 1] - starts
+        if not lengths.sum():
+            return
+        
+        # Words of all these sentences, in order
+        word_indices = np.arange(lengths.sum()) + \
+                       np.repeat(starts - np.cumsum(lengths) + lengths,
+                                 lengths)
+        word_sentences = np.repeat(sentence_indices, lengths)
+        lemma_ids = book.word_lemma[word_indices]
+        pos_ids = book.word_pos[word_indices]
+        
+        # Words without lemma have no role (see LemmaMatcher.roles())
+        candidates = tbstore.vocabulary_mask(
+                         matcher.candidate_mask(book.lemmata), lemma_ids)
+        verbs = (lemma_ids != tbstore.MISSING) & tbstore.vocabulary_mask(
+                    matcher.verb_mask(book.pos_tags), pos_ids)
+        
+        for position in np.flatnonzero(candidates | verbs).tolist():
+            matches = self.matches.setdefault(
+                          int(word_sentences[position]), [])
+            word_id = book.word_n[word_indices[position]]
+            lemma = book.value('lemmata', lemma_ids[position])
+            if candidates[position]:
+                matches.append((word_id, lemma, CANDIDATE_ROLE))
+            if verbs[position]:
+                matches.append((word_id, lemma, VERB_ROLE))
+        
+        # Texts of the sentences which may give facts, decoded at once
+        fact_indices = np.unique(word_sentences[candidates])
+        fact_starts = book.sentence_offsets[fact_indices]
+        fact_lengths = book.sentence_offsets[fact_indices + 1] - \
+                       fact_starts
+        token_ids = book.word_token[
+                        np.arange(fact_lengths.sum()) +
+                        np.repeat(fact_starts - np.cumsum(fact_lengths) +
+                                  fact_lengths, fact_lengths)]
+        self.texts = dict(zip(fact_indices.tolist(), 
+                              book.join_values('tokens', token_ids,
+                                               fact_lengths)))
+    
+    def sentences(self, start, end):
+        """Yield index, mountain stids and person pids of the sentences 
+           with NEs in the range of sentences given."""
+        first, last = np.searchsorted(self.sentence_indices, [start, end])
+        for position in range(first, last):
+            stids, pids = self.entities[position]
+            yield (int(self.sentence_indices[position]), stids, pids)
+
+class StoredArticleTranslated(ArticleTranslated):
+    """Article pair of books in the store (see BookTranslated); its 
+       sentences with NEs and their words matched are taken from the
+       scans of the books (see StoredScan), so only the sentences with
+       NEs are views."""
+    
+    def __init__(self, article_pair, yearbook, book_ne, pair_id,
+                 matchers=None, scans=None):
+        self.scans = scans
+        ArticleTranslated.__init__(self, article_pair, yearbook, book_ne,
+                                   pair_id, matchers)
+    
+    def _read_sentences(self, article_pair):
+        """Set the ranges of sentences of the article (in both 
+           languages)."""
+        for lang, article in zip([DE_LANG, FR_LANG], article_pair):
+            offsets = article.book.article_offsets
+            sentences = range(offsets[article.index], 
+                              offsets[article.index + 1])
+            if lang == DE_LANG:
+                self.sentences_de = sentences
+                self.sentences_de_number = len(sentences)
+            else:
+                self.sentences_fr = sentences
+                self.sentences_fr_number = len(sentences)
+    
+    def _sentences_with_entities(self, lang):
+        """Yield sentences (views) of the language given which contain 
+           NEs, with the stids of their mountains and the pids of their
+           persons."""
+        sentences = self.sentences_de
+        if lang == FR_LANG:
+            sentences = self.sentences_fr
+        
+        scan = self.scans[lang]
+        for sentence_index, stids, pids in scan.sentences(sentences.start,
+                                                          sentences.stop):
+            yield (tbstore.StoredSentence(scan.book, sentence_index), 
+                   stids, pids)
+    
+    def _match(self, sentence, lang, matcher):
+        """Return matches of a sentence's words, as found by the scan."""
+        return self.scans[lang].matches.get(sentence.index, [])
+    
+    def _sentence_text(self, sentence, lang):
+        """Return text of a sentence, as decoded by the scan."""
+        return self.scans[lang].texts[sentence.index]
+
 class BookTranslated:
     """Class which holds translated articles of an SAC year book."""
     
-    def __init__(self, filepath):
+    def __init__(self, filepath, use_store=USE_STORE):
         self.filepath = filepath
         self.yearbook = ''
         self.articles_pairs = []
         self.articles_number = 0
         self.articles_mapping = {} # Mapping of articles numbers de->fr
+        self.stored_books = {} # Language -> book, where both are stored
         
+        if use_store:
+            self._open_stored_books()
         self._read_article_pairs()
         self._print_text("Article pair read. Article pair count: " +\
                          str(self.articles_number))
 
     def _print_text(self, text):
         """Print text with yearbook year info in prefix."""
-        print('Yearbook ' + self.yearbook + ":", text)
+        debug('Yearbook ' + self.yearbook + ":", text)
    
     def _fr_filepath(self, filepath):
         """Return filepath of French SAC yearbook file."""
         return filepath.replace(DE_LANG, FR_LANG)
         
-    def _read_articles(self, filepath):
+    def _open_stored_books(self):
+        """Open books of both languages in the store (see tbstore); they
+           are only used where both are stored."""
+        books = {}
+        for lang, filepath in [(DE_LANG, self.filepath),
+                               (FR_LANG, self._fr_filepath(self.filepath))]:
+            books[lang] = tbstore.open_book(basename(filepath), STORE_DIR,
+                                            SAC_XML_DIR)
+        if None not in books.values():
+            self.stored_books = books
+    
+    def _read_articles(self, filepath, lang):
         """Method to generically return articles from a SAC year book.
+           (Articles of books in the store are views offering the same
+           element interface.)
         """
+        if lang in self.stored_books:
+            book = self.stored_books[lang]
+            self.yearbook = book.book_id.split('_')[0]
+            return book.articles()
+        
         sac_book_elem = etree.parse(filepath).xpath('/book')[0]
         self.yearbook = sac_book_elem.attrib['id'].split('_')[0]
-        sac_book_articles = sac_book_elem.xpath('article')
+        sac_book_articles = sac_book_elem.findall('article')
         
         """
         for sac_book_article in sac_book_articles:
@@ -297,8 +683,8 @@ class BookTranslated:
            German and French language in SAC.
         """
         filepath_fr = self._fr_filepath(self.filepath)
-        articles_de = self._read_articles(self.filepath)
-        articles_fr = self._read_articles(filepath_fr)
+        articles_de = self._read_articles(self.filepath, DE_LANG)
+        articles_fr = self._read_articles(filepath_fr, FR_LANG)
         
         # Find German-French corresponding articles
         for article in articles_de:
@@ -349,7 +735,7 @@ class Person:
 class BookNE:
     """Class which holds a book's Named Entities."""
     
-    def __init__(self, year):
+    def __init__(self, year, streaming=STREAMING_NER):
         self.year = year
         self.mountains_de = []
         self.mountains_fr = []
@@ -363,10 +749,91 @@ class BookNE:
         self.XML_PATH_PERSONS = '/ner/persons'
         
         # Collect NEs
-        self._source_mountains(DE_LANG)
-        self._source_mountains(FR_LANG)
-        self._source_persons(DE_LANG)
-        self._source_persons(FR_LANG)
+        if streaming:
+            self._source_named_entities(DE_LANG)
+            self._source_named_entities(FR_LANG)
+        else:
+            self._source_mountains(DE_LANG)
+            self._source_mountains(FR_LANG)
+            self._source_persons(DE_LANG)
+            self._source_persons(FR_LANG)
+        
+        # Sentence id -> mountain stids and person pids in it
+        self.sentence_index_de = self._index_sentences(DE_LANG)
+        self.sentence_index_fr = self._index_sentences(FR_LANG)
+    
+    def _index_sentences(self, lang):
+        """Return index of the NEs by sentence id: stids of the mountains
+           and pids of the persons in each sentence (once each, in the
+           order of the NER file). Sentence ids are the word ids
+           without their last part, e. g. '3-12' of '3-12-5'."""
+        mountains = self.mountains_de
+        persons = self.persons_de
+        if lang == FR_LANG:
+            mountains = self.mountains_fr
+            persons = self.persons_fr
+        
+        index = {}
+        for mountain in mountains:
+            for position in mountain.location:
+                stids, pids = index.setdefault(position.rsplit('-', 1)[0],
+                                               ([], []))
+                if mountain.stid not in stids:
+                    stids.append(mountain.stid)
+        for person in persons:
+            for location in person.locations:
+                for location_part in location:
+                    stids, pids = index.setdefault(
+                                      location_part.rsplit('-', 1)[0], 
+                                      ([], []))
+                    if person.pid not in pids:
+                        pids.append(person.pid)
+        
+        return index
+    
+    def sentence_index(self, lang):
+        """Return index of the NEs by sentence id (see 
+           _index_sentences())."""
+        if lang == FR_LANG:
+            return self.sentence_index_fr
+        return self.sentence_index_de
+    
+    def _source_named_entities(self, lang):
+        """Collect mountains and persons in NER file in one pass; elements
+           are dropped once read."""
+        mountains = self.mountains_de
+        persons = self.persons_de
+        filepath = self.filepath_de
+        if lang == FR_LANG:
+            mountains = self.mountains_fr
+            persons = self.persons_fr
+            filepath = self.filepath_fr
+        
+        for event, sac_elem in etree.iterparse(filepath, events=('end',),
+                                               tag=('g', 'person')):
+            if sac_elem.tag == 'g':
+                # <g> elements (of <geo>), where type is a mountain
+                if sac_elem.get('type') == 'mountain' and \
+                   next(sac_elem.iterancestors('geo'), None) is not None:
+                    mountain = Mountain()
+                    mountain.stid = sac_elem.attrib['stid']
+                    mountain.location = sac_elem.attrib['span'].split(',')
+                    mountains.append(mountain)
+            elif sac_elem.getparent().tag == 'persons':
+                person = Person()
+                person.pid = sac_elem.attrib['id']
+                person.firstname = sac_elem.find('firstname').text
+                person.lastname = sac_elem.find('lastname').text
+                for sac_per_position in sac_elem.iter('positions'):
+                    person.locations.append([sac_position_part.text
+                                             for sac_position_part
+                                             in sac_per_position.\
+                                                 findall('position')])
+                persons.append(person)
+            
+            sac_elem.clear()
+            while sac_elem.getprevious() is not None:
+                del sac_elem.getparent()[0]
     
     def _source_mountains(self, lang):
         """Collect mountains in NER file."""
@@ -490,39 +957,162 @@ class BookNE:
     return geo_ne_dict
     '''
 
-def explore_bergsteiger(book_translated, year, book_ne):
+def explore_bergsteiger(book_translated, year, book_ne, matchers=None,
+                        facts=None):
+    
+    # Matchers are built once for all article pairs
+    if matchers is None:
+        matchers = load_matchers()
     
     # Get article pair of yearbook given
     articles_pairs = book_translated.articles_pairs
     
+    # Books in the store are scanned as a whole first
+    scans = None
+    if book_translated.stored_books:
+        scans = dict((lang, StoredScan(book, book_ne.sentence_index(lang),
+                                       matchers.get(lang)))
+                     for lang, book in book_translated.stored_books.items())
+    
     # Go through each article pair
     pair_id = 1
+    number_of_sentences = 0
     for article_pair in articles_pairs:
-        article_translated = ArticleTranslated(article_pair, year, 
-                                               book_ne, pair_id)
+        if scans is not None:
+            article_translated = StoredArticleTranslated(article_pair, 
+                                                         year, book_ne,
+                                                         pair_id, matchers,
+                                                         scans)
+        else:
+            article_translated = ArticleTranslated(article_pair, year, 
+                                                   book_ne, pair_id, 
+                                                   matchers)
         pair_id += 1
-        print(article_translated)
-
-def process_xml():
+        number_of_sentences += article_translated.sentences_de_number + \
+                               article_translated.sentences_fr_number
+        if facts is not None:
+            facts.extend(article_translated.facts)
+        debug(article_translated)
     
-    global YEAR_RANGE
-    
-    # If there's an argument assume it to be a year number
-    if len(sys.argv) > 1:
-        YEAR_RANGE = [sys.argv[1]]
+    # Number of sentences scanned (both languages)
+    return number_of_sentences
+
+def pop_option(argv, option):
+    """Remove an option and its value from the arguments; return the
+       value (None if the option isn't given)."""
+    if option not in argv[:-1]:
+        return None
+    index = argv.index(option)
+    value = argv[index + 1]
+    del argv[index:index + 2]
+    return value
+
+def process_year(job):
+    """Process a single year (pairing, NER loading, candidate scan); 
+       return year, output (if captured, else None), the wall and CPU
+       time and counters of the stages profiled and the candidate facts
+       found."""
+    year, matchers, use_store, capture_output = job
+    profiler = tbprofile.Profiler()
+    output = None
+    facts = []
     
-    # Iterate through all german documents, 1957-2011 (by default)
-    for year in YEAR_RANGE:
+    filehdl = capture_output and StringIO() or sys.stdout
+    with redirect_stdout(filehdl):
         filepath_base = SAC_XML_DIR + FILENAME_PREFIX + \
                         str(year) + '_' + DE_LANG 
         filepath = filepath_base + XML_SUFFIX
-        book_translated = BookTranslated(filepath)
+        with profiler.stage('pairing') as profiled_stage:
+            book_translated = BookTranslated(filepath, use_store)
+            profiled_stage.count(articles=book_translated.articles_number)
         
         # Search for people who climbed (supposedely) mountains
-        book_ne = BookNE(year)
-        print('%')
-        print(book_ne.mountain_positions('de'))
-        explore_bergsteiger(book_translated, year, book_ne)
+        with profiler.stage('ner_load') as profiled_stage:
+            book_ne = BookNE(year)
+            profiled_stage.count(mountains=len(book_ne.mountains_de) + 
+                                           len(book_ne.mountains_fr),
+                                 persons=len(book_ne.persons_de) + 
+                                         len(book_ne.persons_fr))
+        debug('%')
+        debug(book_ne.mountain_positions('de'))
+        with profiler.stage('candidate_scan') as profiled_stage:
+            number_of_sentences = explore_bergsteiger(book_translated, 
+                                                      year, book_ne, 
+                                                      matchers, facts)
+            profiled_stage.count(articles=book_translated.articles_number,
+                                 sentences=number_of_sentences,
+                                 facts=len(facts))
+    if capture_output:
+        output = filehdl.getvalue()
+    
+    return (year, output, [(stage.name, stage.wall_seconds, 
+                            stage.cpu_seconds, stage.counters)
+                           for stage in profiler.stages], facts)
+
+def process_xml():
+    
+    global YEAR_RANGE, PRINT_DEBUG
+    
+    argv = list(sys.argv)
+    if QUIET_OPTION in argv:
+        argv.remove(QUIET_OPTION)
+        PRINT_DEBUG = False
+    use_store = USE_STORE
+    if STORE_OPTION in argv:
+        argv.remove(STORE_OPTION)
+        use_store = True
+    facts_filepath = pop_option(argv, FACTS_OPTION)
+    profile_filepath = pop_option(argv, PROFILE_OPTION)
+    profiler = tbprofile.Profiler()
+    matchers = load_matchers(pop_option(argv, MATCHER_OPTION))
+    jobs = int(pop_option(argv, JOBS_OPTION) or 1)
+    
+    # Years given as from_year[-to_year]
+    years = pop_option(argv, YEARS_OPTION)
+    if years is not None:
+        years = [int(year) for year in years.split('-')]
+        YEAR_RANGE = range(years[0], years[-1] + 1)
+    if len(argv) > 1:
+        print('Usage: ' + argv[0] + ' [' + YEARS_OPTION + 
+              ' from_year[-to_year]] [' + JOBS_OPTION + ' N] [' + 
+              MATCHER_OPTION + ' FILE] [' + FACTS_OPTION + ' FILE] [' + 
+              QUIET_OPTION + '] [' + STORE_OPTION + '] [' + 
+              PROFILE_OPTION + ' FILE]')
+        sys.exit(2)
+    
+    # Iterate through all german documents, 1957-2011 (by default). 
+    # Years processed in a pool are output in year order, the same as
+    # processed one after another.
+    fact_writer = None
+    if facts_filepath is not None:
+        fact_writer = FactWriter(facts_filepath)
+    pool = None
+    results = map(process_year, [(year, matchers, use_store, False) 
+                                 for year in YEAR_RANGE])
+    if jobs > 1:
+        pool = Pool(jobs)
+        results = pool.imap(process_year, [(year, matchers, use_store, 
+                                            True) for year in YEAR_RANGE])
+    try:
+        for year, output, stages, facts in results:
+            if output is not None:
+                sys.stdout.write(output)
+            for name, seconds, cpu_seconds, counters in stages:
+                profiler.stage(name).add(seconds, cpu_seconds, **counters)
+            if fact_writer is not None:
+                for fact in facts:
+                    fact_writer.write(fact)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if fact_writer is not None:
+            fact_writer.close()
+    
+    if fact_writer is not None:
+        print('Candidate facts written to ' + facts_filepath + ': ' + 
+              str(fact_writer.number_of_facts))    
+    if profile_filepath is not None:
+        profiler.write(profile_filepath)
     
 def main():
     process_xml()
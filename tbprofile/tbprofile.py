@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Profiling of the stages of a run, shared by tbta and bergbest: wall
+   time and CPU time of each stage, along with counters (tokens, 
+   articles, sentences, ...) the throughputs are derived from. Memory 
+   is only known per process: the peak of the run is given, and for
+   each stage the peak reached by the end of it. The metrics are 
+   written to a JSON file."""
+
+from io import open
+from json import dumps
+from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+from time import time
+
+# Usage of the calling thread only (Linux, Python 3.2 and later)
+try:
+    from resource import RUSAGE_THREAD
+except ImportError:
+    RUSAGE_THREAD = RUSAGE_SELF
+
+def cpu_seconds():
+    """Return CPU time (user and system) of this process and of its
+       terminated child processes (e. g. of a pool) so far."""
+    usage_self = getrusage(RUSAGE_SELF)
+    usage_children = getrusage(RUSAGE_CHILDREN)
+    return usage_self.ru_utime + usage_self.ru_stime + \
+           usage_children.ru_utime + usage_children.ru_stime
+
+def thread_cpu_seconds():
+    """Return CPU time (user and system) of the calling thread so far --
+       of the whole process where usage per thread isn't available. 
+       Meant for work measured in worker processes (see 
+       ProfiledStage.add())."""
+    usage = getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+def peak_rss():
+    """Return peak resident memory (in megabytes) of this process or of
+       its largest child process so far (ru_maxrss is given in kilobytes
+       on Linux)."""
+    return max(getrusage(RUSAGE_SELF).ru_maxrss,
+               getrusage(RUSAGE_CHILDREN).ru_maxrss) / 1024.0
+
+class ProfiledStage:
+    """Measurements of a single stage; used as context manager around
+       the stage's code (several times, for stages run repeatedly)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.process_peak_rss = 0.0 # Not the stage's own memory
+        self.counters = {}
+        self._start_wall = None
+        self._start_cpu = None
+
+    def count(self, **counters):
+        """Add to counters of the stage, e. g. count(tokens=5)."""
+        for name, amount in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add(self, seconds, cpu_seconds, **counters):
+        """Add work measured elsewhere, e. g. in worker processes: wall
+           and CPU time (see thread_cpu_seconds()) along with counters."""
+        self.wall_seconds += seconds
+        self.cpu_seconds += cpu_seconds
+        self.process_peak_rss = max(self.process_peak_rss, peak_rss())
+        self.count(**counters)
+
+    def __enter__(self):
+        self._start_wall = time()
+        self._start_cpu = cpu_seconds()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_seconds += time() - self._start_wall
+        self.cpu_seconds += cpu_seconds() - self._start_cpu
+        self.process_peak_rss = max(self.process_peak_rss, peak_rss())
+        return False
+
+    def metrics(self):
+        """Return metrics of the stage with throughputs (per second of
+           wall time) of all counters."""
+        throughputs = {}
+        for name, amount in self.counters.items():
+            throughputs[name + '/s'] = amount / max(self.wall_seconds,
+                                                    1e-9)
+
+        return {
+                'stage' : self.name,
+                'wall_seconds' : self.wall_seconds,
+                'cpu_seconds' : self.cpu_seconds,
+                'process_peak_rss_mb' : self.process_peak_rss,
+                'counters' : self.counters,
+                'throughputs' : throughputs
+               }
+
+class Profiler:
+    """Stages of a run, in the order they were first entered."""
+
+    def __init__(self):
+        self.stages = []
+        self._stages_by_name = {}
+
+    def stage(self, name):
+        """Return stage of the name given (created where new)."""
+        if name not in self._stages_by_name:
+            self._stages_by_name[name] = ProfiledStage(name)
+            self.stages.append(self._stages_by_name[name])
+        return self._stages_by_name[name]
+
+    def write(self, filepath):
+        """Write metrics of all stages to a JSON file."""
+        with open(filepath, 'w', encoding='utf-8') as filehdl:
+            filehdl.write(u'' + dumps({'stages' : [stage.metrics()
+                                                   for stage
+                                                   in self.stages],
+                                       'peak_rss_mb' : peak_rss()},
+                                      indent=2, sort_keys=True) + u'\n')
+        print('Profile written to ' + filepath + '.')
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Columnar store of the Text+Berg SAC year books, shared by tbta and
+   bergbest: every book is converted once from XML into a folder of
+   NumPy arrays, which are memory-mapped when read."""
+
+from io import open
+from json import dumps, load
+from os import sep, sys, listdir, makedirs, rename, stat
+from os.path import exists, isdir
+from shutil import rmtree
+from array import array
+from lxml import etree
+import numpy as np
+
+ENCODING = 'utf-8'
+
+# SAC XML folder path
+SAC_XML_DIR = 'Text+Berg_Release_147_v03' + sep + 'XML' + sep \
+            + 'SAC' + sep
+
+# Folder holding the converted books (one folder per book)
+STORE_DIR = 'Text+Berg_Release_147_v03' + sep + 'STORE' + sep \
+          + 'SAC' + sep
+
+# XML suffix
+XML_SUFFIX = '.xml'
+
+# NER filename substring, these files aren't converted
+NER_SUBSTR = '-ner'
+
+# Version of the store layout (stores of other versions are rebuilt)
+STORE_VERSION = 1
+
+# Id of values missing in a vocabulary column (e. g. words without lemma)
+MISSING = 0xFFFFFFFF
+
+# Columns coded by a vocabulary (value ids -> vocabulary strings)
+VOCABULARY_COLUMNS = {
+                      'word_token' : 'tokens',
+                      'word_lemma' : 'lemmata',
+                      'word_pos' : 'pos_tags',
+                      'sentence_lang' : 'langs'
+                     }
+
+# Columns holding a string per element
+STRING_COLUMNS = ['word_n', 'sentence_n', 'article_n',
+                  'article_translation_of', 'article_title']
+
+def store_dirpath(xml_filename, store_dir=STORE_DIR):
+    """Return folder path of a book in the store, e. g. for
+       'SAC-Jahrbuch_1957_de.xml'."""
+    return store_dir + xml_filename[:-len(XML_SUFFIX)] + sep
+
+def open_book(xml_filename, store_dir=STORE_DIR, xml_dir=SAC_XML_DIR):
+    """Return stored book of an XML file, or None if it isn't stored or
+       the XML file has changed since it was converted."""
+    dirpath = store_dirpath(xml_filename, store_dir)
+    if not exists(dirpath + 'meta.json'):
+        return None
+
+    book = StoredBook(dirpath)
+    if book.meta['version'] != STORE_VERSION:
+        return None
+
+    # The store can be used without the XML files, too.
+    if exists(xml_dir + xml_filename):
+        xml_stat = stat(xml_dir + xml_filename)
+        if [book.meta['source_size'], book.meta['source_mtime']] != \
+           [xml_stat.st_size, xml_stat.st_mtime]:
+            return None
+
+    return book
+
+def vocabulary_mask(mask, value_ids):
+    """Return mask of the value ids given, taken from the mask of their
+       vocabulary (MISSING ids are never set)."""
+    return np.append(mask, False)[np.minimum(value_ids, len(mask))]
+
+class StringColumn:
+    """Column of strings: the UTF-8 bytes of all strings in one array
+       and the offsets of each string."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].\
+               tobytes().decode(ENCODING)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def index(self, value):
+        """Return index of the value given (ValueError if missing)."""
+        index = self.indices([value])[0]
+        if index < 0:
+            raise ValueError(value)
+        return int(index)
+
+    def array(self):
+        """Return all strings as a NumPy array of UTF-8 bytes, built from
+           the column's data at once; meant for columns of short strings
+           (e. g. ids), as every string is padded to the longest one."""
+        lengths = np.diff(self.offsets)
+        width = max(int(lengths.max()) if len(lengths) else 0, 1)
+        positions = np.arange(width)
+        mask = positions < lengths[:, np.newaxis]
+        matrix = np.zeros((len(lengths), width), dtype=np.uint8)
+        matrix[mask] = self.data[(self.offsets[:-1, np.newaxis] +
+                                  positions)[mask]]
+        return matrix.view('S' + str(width)).reshape(-1)
+
+    def indices(self, values):
+        """Return indices of the values given (-1 for missing ones), all
+           looked up at once (see array())."""
+        result = np.full(len(values), -1, dtype=np.int64)
+        if not len(values) or not len(self):
+            return result
+        strings = self.array()
+        order = np.argsort(strings, kind='mergesort') # First one counts
+        wanted = np.array([value.encode(ENCODING) for value in values])
+        positions = np.minimum(np.searchsorted(strings[order], wanted),
+                               len(strings) - 1)
+        found = strings[order][positions] == wanted
+        result[found] = order[positions[found]]
+        return result
+
+class StringColumnWriter:
+    """Collects strings of a column, to be saved as a StringColumn."""
+
+    def __init__(self):
+        self.data = array('B')
+        self.offsets = array('l', [0])
+
+    def append(self, value):
+        value = (value or u'').encode(ENCODING)
+        self.data.extend(array('B', value))
+        self.offsets.append(len(self.data))
+
+    def save(self, filepath):
+        np.save(filepath + '.data.npy', np.array(self.data, dtype=np.uint8))
+        np.save(filepath + '.offsets.npy', np.array(self.offsets,
+                                                   dtype=np.int64))
+
+class VocabularyWriter:
+    """Collects the values of vocabulary coded columns."""
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = StringColumnWriter()
+
+    def id(self, value):
+        """Return id of the value (MISSING for None)."""
+        if value is None:
+            return MISSING
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.ids)
+            self.strings.append(value)
+        return value_id
+
+class StoredBook:
+    """A single book read from the store. Its columns are memory-mapped
+       NumPy arrays: words (token, lemma, PoS ids and n ids), sentences
+       (word offsets, n ids, language ids) and articles (sentence
+       offsets, n ids, translation links and titles)."""
+
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        with open(dirpath + 'meta.json', 'r', encoding=ENCODING) as filehdl:
+            self.meta = load(filehdl)
+        self.book_id = self.meta['book_id']
+
+        for column in VOCABULARY_COLUMNS:
+            setattr(self, column, self._load(column))
+        for vocabulary in VOCABULARY_COLUMNS.values():
+            setattr(self, vocabulary, self._load_strings(vocabulary))
+        for column in STRING_COLUMNS:
+            setattr(self, column, self._load_strings(column))
+        self.sentence_offsets = self._load('sentence_offsets')
+        self.article_offsets = self._load('article_offsets')
+
+    def _load(self, name):
+        # Plain array view of the memory map (slices of np.memmap objects
+        # are memmaps, too, which makes slicing a lot slower)
+        return np.asarray(np.load(self.dirpath + name + '.npy',
+                                  mmap_mode='r'))
+
+    def _load_strings(self, name):
+        return StringColumn(self._load(name + '.data'),
+                            self._load(name + '.offsets'))
+
+    def value(self, vocabulary, value_id):
+        """Return string of a vocabulary id (None for MISSING)."""
+        if value_id == MISSING:
+            return None
+        return getattr(self, vocabulary)[value_id]
+
+    def join_values(self, vocabulary, value_ids, group_lengths,
+                    separator=u' '):
+        """Return strings of the groups of vocabulary ids given (e. g. 
+           the token ids of sentences, by their numbers of words): the
+           strings of each group's ids joined by the separator (empty
+           for MISSING). All are gathered from the vocabulary's data at
+           once, and decoded per group."""
+        column = getattr(self, vocabulary)
+        value_ids = np.asarray(value_ids, dtype=np.int64)
+        starts = np.zeros(len(value_ids), dtype=np.int64)
+        lengths = np.zeros(len(value_ids), dtype=np.int64)
+        present = value_ids != MISSING
+        starts[present] = column.offsets[value_ids[present]]
+        lengths[present] = column.offsets[value_ids[present] + 1] - \
+                           starts[present]
+        
+        # Bytes of each value, each followed by the separator's
+        separator = separator.encode(ENCODING)
+        ends = np.cumsum(lengths)
+        shifts = np.repeat(ends - lengths, lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0)
+        out_starts = ends - lengths + np.arange(len(lengths)) * \
+                     len(separator)
+        joined = np.zeros(len(positions) + len(separator) * len(lengths),
+                          dtype=np.uint8)
+        joined[np.repeat(out_starts, lengths) + positions - shifts] = \
+            column.data[np.repeat(starts, lengths) + positions - shifts]
+        for position, byte in enumerate(bytearray(separator)):
+            joined[out_starts + lengths + position] = byte
+        joined = joined.tobytes()
+        
+        # A group ends before the separator of its last value
+        strings = []
+        group_ends = np.cumsum(group_lengths).tolist()
+        for group_start, group_end in zip([0] + group_ends[:-1], 
+                                          group_ends):
+            if group_start == group_end:
+                strings.append(u'')
+                continue
+            strings.append(joined[int(out_starts[group_start]):
+                                  int(out_starts[group_end - 1] + 
+                                      lengths[group_end - 1])].\
+                           decode(ENCODING))
+        return strings
+    
+    def number_of_articles(self):
+        return len(self.article_offsets) - 1
+
+    def articles(self):
+        """Return all articles as element views."""
+        return [StoredArticle(self, article_index) for article_index
+                in range(self.number_of_articles())]
+
+class StoredArticle:
+    """View of a stored article; offers the part of the ElementTree API
+       (attrib, find, iter) the tools use on <article> elements."""
+
+    def __init__(self, book, index):
+        self.book = book
+        self.index = index
+        self.attrib = {'n' : book.article_n[index]}
+        translation_of = book.article_translation_of[index]
+        if translation_of:
+            self.attrib['translation-of'] = translation_of
+
+    def find(self, tag):
+        """Return the article's <tocEntry> (or None)."""
+        title = self.book.article_title[self.index]
+        if tag == 'tocEntry' and title:
+            return StoredTocEntry(title)
+        return None
+
+    def iter(self, tag='s'):
+        """Yield the article's sentences."""
+        for sentence_index in range(self.book.article_offsets[self.index],
+                                    self.book.article_offsets[self.index +
+                                                              1]):
+            yield StoredSentence(self.book, sentence_index)
+
+class StoredTocEntry:
+    """View of an article's <tocEntry>."""
+
+    def __init__(self, title):
+        self.attrib = {'title' : title}
+
+class StoredSentence:
+    """View of a stored sentence; offers attrib, findall and iter for
+       its <w> elements."""
+
+    def __init__(self, book, index):
+        self.book = book
+        self.index = index
+        self.attrib = {'n' : book.sentence_n[index]}
+        lang = book.value('langs', book.sentence_lang[index])
+        if lang is not None:
+            self.attrib['lang'] = lang
+
+    def findall(self, tag='w'):
+        """Return the sentence's words."""
+        return list(self.iter(tag))
+
+    def iter(self, tag='w'):
+        """Yield the sentence's words."""
+        for word_index in range(self.book.sentence_offsets[self.index],
+                                self.book.sentence_offsets[self.index + 1]):
+            yield StoredWord(self.book, word_index)
+
+class StoredWord:
+    """View of a stored word; offers attrib (n, lemma, pos) and text."""
+
+    def __init__(self, book, index):
+        self.attrib = {'n' : book.word_n[index]}
+        self.text = book.value('tokens', book.word_token[index])
+        for attribute, column, vocabulary in \
+            [('lemma', book.word_lemma, 'lemmata'),
+             ('pos', book.word_pos, 'pos_tags')]:
+            value = book.value(vocabulary, column[index])
+            if value is not None:
+                self.attrib[attribute] = value
+
+def convert_book(xml_filepath, dirpath):
+    """Convert a single XML book into the store folder given."""
+    vocabularies = dict((vocabulary, VocabularyWriter()) for vocabulary
+                        in VOCABULARY_COLUMNS.values())
+    columns = dict((column, array('I')) for column in VOCABULARY_COLUMNS)
+    strings = dict((column, StringColumnWriter())
+                   for column in STRING_COLUMNS)
+    sentence_offsets = array('l', [0])
+    article_offsets = array('l', [0])
+
+    def add(column, value):
+        vocabulary = vocabularies[VOCABULARY_COLUMNS[column]]
+        columns[column].append(vocabulary.id(value))
+
+    # Articles are streamed, and dropped once converted
+    context = etree.iterparse(xml_filepath, events=('end',), tag='article')
+    for event, xml_article in context:
+        strings['article_n'].append(xml_article.get('n'))
+        strings['article_translation_of'].append(
+            xml_article.get('translation-of'))
+        xml_toc_entry = xml_article.find('tocEntry')
+        strings['article_title'].append(xml_toc_entry is not None and
+                                        xml_toc_entry.get('title') or None)
+
+        for xml_sentence in xml_article.iter('s'):
+            strings['sentence_n'].append(xml_sentence.get('n'))
+            add('sentence_lang', xml_sentence.get('lang'))
+            for xml_word in xml_sentence.iter('w'):
+                strings['word_n'].append(xml_word.get('n'))
+                add('word_token', xml_word.text)
+                add('word_lemma', xml_word.get('lemma'))
+                add('word_pos', xml_word.get('pos'))
+            sentence_offsets.append(len(columns['word_token']))
+        article_offsets.append(len(sentence_offsets) - 1)
+
+        xml_article.clear()
+        while xml_article.getprevious() is not None:
+            del xml_article.getparent()[0]
+
+    # Written to a temporary folder first, so that interrupted
+    # conversions don't leave incomplete books.
+    tmp_dirpath = dirpath.rstrip(sep) + '.tmp' + sep
+    if exists(tmp_dirpath):
+        rmtree(tmp_dirpath)
+    makedirs(tmp_dirpath)
+
+    for column, values in columns.items():
+        np.save(tmp_dirpath + column + '.npy', np.array(values,
+                                                        dtype=np.uint32))
+    for vocabulary, writer in vocabularies.items():
+        writer.strings.save(tmp_dirpath + vocabulary)
+    for column, writer in strings.items():
+        writer.save(tmp_dirpath + column)
+    np.save(tmp_dirpath + 'sentence_offsets.npy',
+            np.array(sentence_offsets, dtype=np.int64))
+    np.save(tmp_dirpath + 'article_offsets.npy',
+            np.array(article_offsets, dtype=np.int64))
+
+    xml_stat = stat(xml_filepath)
+    meta = {
+            'version' : STORE_VERSION,
+            'book_id' : context.root.get('id'),
+            'source_size' : xml_stat.st_size,
+            'source_mtime' : xml_stat.st_mtime,
+            'articles' : len(article_offsets) - 1,
+            'sentences' : len(sentence_offsets) - 1,
+            'words' : len(columns['word_token'])
+           }
+    with open(tmp_dirpath + 'meta.json', 'wb') as filehdl:
+        filehdl.write(dumps(meta, sort_keys=True).encode(ENCODING))
+
+    if exists(dirpath):
+        rmtree(dirpath)
+    rename(tmp_dirpath, dirpath)
+
+    return meta
+
+def convert_collection(xml_dir=SAC_XML_DIR, store_dir=STORE_DIR):
+    """Convert all year books (except NER files) not stored yet."""
+    if not isdir(store_dir):
+        makedirs(store_dir)
+
+    for xml_filename in sorted(listdir(xml_dir)):
+        if not xml_filename.endswith(XML_SUFFIX) \
+        or xml_filename.endswith(NER_SUBSTR + XML_SUFFIX):
+            continue
+        if open_book(xml_filename, store_dir, xml_dir) is not None:
+            print('Up to date: ' + xml_filename)
+            continue
+
+        meta = convert_book(xml_dir + xml_filename,
+                            store_dirpath(xml_filename, store_dir))
+        print('Converted: ' + xml_filename + ' (' +
+              str(meta['articles']) + ' articles, ' +
+              str(meta['sentences']) + ' sentences, ' +
+              str(meta['words']) + ' words)')
+
+def main():
+
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        print('TBSTORE: Convert Text+Berg XML year books into the ' +
+              'columnar store\n')
+        print(sys.argv[0] + ' [xml folder [store folder]]')
+        print('Defaults: ' + SAC_XML_DIR + ' ' + STORE_DIR)
+        sys.exit(0)
+
+    xml_dir = SAC_XML_DIR
+    store_dir = STORE_DIR
+    if len(sys.argv) > 1:
+        xml_dir = sys.argv[1].rstrip(sep) + sep
+    if len(sys.argv) > 2:
+        store_dir = sys.argv[2].rstrip(sep) + sep
+
+    convert_collection(xml_dir, store_dir)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Scaling benchmark of tbta and bergbest on synthetic collections (see
+   tbsynth): for every scale (articles per book) a collection is written
+   to its own working folder, tbta's preprocessing (reading, dictionary,
+   bag-of-words) and bergbest's candidate extraction (all translated
+   years) are run on it with --profile, and time, throughput and peak
+   memory per scale are reported along with the growth of time by size
+   (log-log slope, 1 is linear)."""
+
+from io import open
+from json import load
+from math import log
+from os import sep, sys, devnull
+from os.path import abspath, dirname, exists, join
+from shutil import rmtree
+from subprocess import call
+
+import tbsynth
+
+# Articles per book of the collections compared
+SCALES = [5, 10, 20, 40]
+
+# Years of the collections (multilingual and translated books)
+YEAR_RANGE = range(1955, 1961)
+
+# Folder holding the working folders of the scales
+BENCH_DIR = 'bench_files' + sep
+
+# Interpreters of the tools
+TBTA_PYTHON = 'python2'
+BERGBEST_PYTHON = 'python3'
+
+# Folders of the tools
+TBTA_DIR = join(dirname(abspath(__file__)), '..', 'tbta')
+BERGBEST_DIR = join(dirname(abspath(__file__)), '..', 'bergbest')
+
+# Profiles written into the working folders
+TBTA_PROFILE = 'tbta_profile.json'
+BERGBEST_PROFILE = 'bergbest_profile.json'
+
+# Stages of tbta's preprocessing (parse and tokenization are part of
+# read)
+TBTA_STAGES = ['read', 'dictionary', 'bow', 'tfidf']
+
+def run_tbta(year_range, profile_filepath):
+    """Run tbta's preprocessing in the working folder (in the tbta
+       interpreter, see main()) and write its profile."""
+    sys.path.append(TBTA_DIR)
+    import tbta
+
+    tbta.create_caching_folders()
+    articles_collection = tbta.ArticlesCollection(year_range, '', 'de',
+                                                  text_format='none')
+    articles_collection.execute_stages()
+    articles_collection.write_profile(profile_filepath)
+
+def read_profile(filepath, stages=None):
+    """Return seconds (sum of the stages given, or of all), counters and
+       peak memory of a profile."""
+    with open(filepath, encoding='utf-8') as filehdl:
+        profile = load(filehdl)
+    seconds = 0.0
+    counters = {}
+    for stage in profile['stages']:
+        if stages is not None and stage['stage'] not in stages:
+            continue
+        seconds += stage['wall_seconds']
+        for name, amount in stage['counters'].items():
+            counters[stage['stage'] + ' ' + name] = amount
+    return seconds, counters, profile['peak_rss_mb']
+
+def bench_scale(articles, year_range):
+    """Write the collection of a scale and run both tools on it; return
+       the measurements."""
+    dirpath = BENCH_DIR + 'articles=' + str(articles) + sep
+    if exists(dirpath):
+        rmtree(dirpath)
+    counts = tbsynth.generate_collection(dirpath, year_range, articles)
+    result = {'articles' : articles, 'words' : counts['words'],
+              'facts' : counts['facts']}
+
+    tbta_years = str(year_range[0]) + '-' + str(year_range[-1])
+    call([TBTA_PYTHON, abspath(__file__), '--tbta', tbta_years,
+          TBTA_PROFILE], cwd=dirpath)
+    seconds, counters, peak_rss_mb = read_profile(dirpath + TBTA_PROFILE,
+                                                  TBTA_STAGES)
+    result['tbta seconds'] = seconds
+    result['tbta tokens'] = counters.get('read tokens', 0)
+    result['tbta peak'] = peak_rss_mb
+
+    # bergbest handles translated years only
+    bergbest_years = str(max(year_range[0],
+                             tbsynth.FIRST_TRANSLATED_YEAR)) + '-' + \
+                     str(year_range[-1])
+    with open(devnull, 'w') as devnull_filehdl:
+        call([BERGBEST_PYTHON, join(BERGBEST_DIR, 'bergbest.py'),
+              '--years', bergbest_years, '--profile', BERGBEST_PROFILE],
+             cwd=dirpath, stdout=devnull_filehdl)
+    seconds, counters, peak_rss_mb = read_profile(dirpath +
+                                                  BERGBEST_PROFILE)
+    result['bergbest seconds'] = seconds
+    result['bergbest sentences'] = counters.get('candidate_scan sentences',
+                                                0)
+    result['bergbest peak'] = peak_rss_mb
+
+    return result
+
+def slope(results, key):
+    """Return slope of log(seconds) by log(words) (least squares)."""
+    points = [(log(result['words']), log(max(result[key], 1e-9)))
+              for result in results]
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    if variance == 0:
+        return float('nan')
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+def main():
+
+    # Child process running tbta (see bench_scale())
+    if len(sys.argv) > 3 and sys.argv[1] == '--tbta':
+        years = [int(year) for year in sys.argv[2].split('-')]
+        run_tbta(range(years[0], years[-1] + 1), sys.argv[3])
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        print(sys.argv[0] + ' [from_year[-to_year]] [articles,articles,...]')
+        print('Example: ' + sys.argv[0] + ' 1955-1965 10,20,40,80')
+        sys.exit(0)
+
+    year_range = YEAR_RANGE
+    if len(sys.argv) > 1:
+        years = [int(year) for year in sys.argv[1].split('-')]
+        year_range = range(years[0], years[-1] + 1)
+    scales = SCALES
+    if len(sys.argv) > 2:
+        scales = [int(articles) for articles in sys.argv[2].split(',')]
+
+    results = []
+    for articles in scales:
+        print('Scale: ' + str(articles) + ' articles per book.')
+        results.append(bench_scale(articles, year_range))
+
+    columns = ['articles', 'words', 'tbta seconds', 'tbta tokens/s',
+               'tbta peak MB', 'bergbest seconds', 'bergbest sent/s',
+               'bergbest peak MB']
+    rows = []
+    for result in results:
+        rows.append([str(result['articles']), str(result['words']),
+                     '%.3f' % result['tbta seconds'],
+                     '%.0f' % (result['tbta tokens'] /
+                               max(result['tbta seconds'], 1e-9)),
+                     '%.1f' % result['tbta peak'],
+                     '%.3f' % result['bergbest seconds'],
+                     '%.0f' % (result['bergbest sentences'] /
+                               max(result['bergbest seconds'], 1e-9)),
+                     '%.1f' % result['bergbest peak']])
+
+    print('')
+    print(' '.join('%16s' % column for column in columns))
+    for row in rows:
+        print(' '.join('%16s' % field for field in row))
+    print('')
+    print('Growth of time by size (log-log slope, 1 is linear): ' +
+          'tbta %.2f, bergbest %.2f' % (slope(results, 'tbta seconds'),
+                                        slope(results, 'bergbest seconds')))
+
+    # Curves for plotting
+    with open(BENCH_DIR + 'scaling.tsv', 'w', encoding='utf-8') as filehdl:
+        filehdl.write(u'\t'.join(columns) + u'\n')
+        for row in rows:
+            filehdl.write(u'\t'.join(row) + u'\n')
+    print('Scaling curves written to ' + BENCH_DIR + 'scaling.tsv.')
+
+if __name__ == '__main__':
+	main()
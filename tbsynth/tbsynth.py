@@ -0,0 +1,450 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Synthetic Text+Berg SAC collection at any scale, for benchmarking tbta
+   and bergbest without the release: year books as XML (<book>,
+   <article>, <tocEntry>, <s>, <w> with n, lang, lemma, pos and
+   translation-of attributes), multilingual books before 1957, German and
+   French translated books from 1957 on with matching NER files (<geo>/<g>
+   mountains, <persons>/<person> with positions). Words are drawn from a
+   Zipf-distributed vocabulary; some sentences are candidate facts (a
+   person, a mountain and a candidate verb)."""
+
+from io import open
+from bisect import bisect
+from os import sep, sys, makedirs
+from os.path import exists
+from random import Random
+from xml.sax.saxutils import escape, quoteattr
+
+ENCODING = 'utf-8'
+
+# SAC XML folder path (relative to the target folder)
+SAC_XML_DIR = 'Text+Berg_Release_147_v03' + sep + 'XML' + sep \
+            + 'SAC' + sep
+
+# Filename prefix and suffixes
+FILENAME_PREFIX = 'SAC-Jahrbuch_'
+XML_SUFFIX = '.xml'
+NER_SUBSTR = '-ner'
+
+# Stop word file tbta reads from its working folder
+STOPWORDS_FILENAME = 'de_stop_words.txt'
+
+# Languages; books before 1957 are multilingual (one book, sentences of
+# both languages)
+DE_LANG = 'de'
+FR_LANG = 'fr'
+MUL_LANG = 'mul'
+FIRST_TRANSLATED_YEAR = 1957
+
+# Default scale: years, articles per book, sentences per article and
+# words per sentence
+YEAR_RANGE = range(1955, 1961)
+ARTICLES = 20
+SENTENCES = 30
+WORDS = 15
+
+# Seed of the generator (same seed, scale and Python version, same
+# collection)
+SEED = 42
+
+# Number of content words per language and exponent of their Zipf
+# distribution
+VOCABULARY_SIZE = 5000
+ZIPF_EXPONENT = 1.1
+
+# Sentences per paragraph
+PARAGRAPH_SENTENCES = 5
+
+# Share of sentences being candidate facts, and of sentences mentioning
+# a mountain or person only
+FACT_RATE = 0.05
+MENTION_RATE = 0.1
+
+# Persons per book (document-wide ids, as in the release)
+PERSONS = 30
+
+# Syllables of the content words
+SYLLABLES = [u'ber', u'gi', u'tal', u'fel', u'sen', u'hor', u'wan', u'grat',
+             u'lo', u'mi', u'pas', u'sa', u'ri', u'ton', u'gle', u'tsch',
+             u'ker', u'mo', u'nu', u'dra', u'schä', u'fü']
+
+# Content word PoS tags and how lemma and surface form are built of the
+# stem: (tag, lemma suffix, surface suffix, capitalized surface)
+CONTENT_POS = {
+               DE_LANG : [('NN', '', '', True), ('NN', 'e', 'en', True),
+                          ('NE', '', '', True), ('ADJA', 'ig', 'ige', False),
+                          ('ADJD', 'lich', 'lich', False),
+                          ('VVFIN', 'en', 'te', False),
+                          ('VVPP', 'en', 'et', False)],
+               FR_LANG : [('N_C', 'e', 'es', False), ('N_C', '', '', False),
+                          ('N_P', '', '', True),
+                          ('A_qual', 'eux', 'euse', False),
+                          ('V', 'er', 'ait', False)]
+              }
+
+# Function words (most frequent ranks): (lemma, PoS tag, surface form)
+FUNCTION_WORDS = {
+                  DE_LANG : [(u'der', 'ART', u'die'), (u'und', 'KON', u'und'),
+                             (u'in', 'APPR', u'in'), (u'wir', 'PPER', u'wir'),
+                             (u'sein', 'VAFIN', u'war'),
+                             (u'auf', 'APPR', u'auf'),
+                             (u'nicht', 'PTKNEG', u'nicht'),
+                             (u'@card@', 'CARD', u'3'),
+                             (u'unk', 'NN', u'Firnfeld'),
+                             (u'über', 'APPR', u'über')],
+                  FR_LANG : [(u'le', 'D_def', u'le'), (u'de', 'P', u'de'),
+                             (u'et', 'C_C', u'et'), (u'à', 'P', u'à'),
+                             (u'nous', 'CL_subj', u'nous'),
+                             (u'être', 'V', u'était'),
+                             (u'ne', 'ADV', u'ne'),
+                             (u'@card@', 'D_card', u'3')]
+                 }
+
+# Sentence end
+PUNCTUATION = {
+               DE_LANG : (u'.', '$.', u'.'),
+               FR_LANG : (u'.', 'PONCT_S', u'.')
+              }
+
+# Candidate verbs of bergbest: (lemma, PoS tag, surface form)
+CANDIDATE_VERBS = {
+                   DE_LANG : [(u'besteigen', 'VVFIN', u'bestieg'),
+                              (u'erreichen', 'VVFIN', u'erreichte'),
+                              (u'gelangen|gelingen', 'VVFIN', u'gelang'),
+                              (u'ersteigen', 'VVPP', u'erstiegen'),
+                              (u'bezwingen', 'VVFIN', u'bezwang')],
+                   FR_LANG : [(u'gravir', 'V', u'gravit'),
+                              (u'atteindre', 'V', u'atteignit'),
+                              (u'escalader', 'V', u'escalada'),
+                              (u'réussir', 'V', u'réussit')]
+                  }
+
+# Mountains (collection-wide ids are their index + 1), other places of
+# the NER files
+MOUNTAINS = [u'Matterhorn', u'Eiger', u'Mönch', u'Jungfrau', u'Tödi',
+             u'Dent Blanche', u'Piz Bernina', u'Weisshorn', u'Dom',
+             u'Finsteraarhorn', u'Grand Combin', u'Piz Palü', u'Säntis',
+             u'Aletschhorn', u'Bietschhorn', u'Dent d\'Hérens']
+PLACES = [u'Zermatt', u'Grindelwald', u'Arolla', u'Pontresina']
+
+# Names the persons are made of
+FIRSTNAMES = [u'Hans', u'Walter', u'Anna', u'Pierre', u'Marie', u'Ulrich',
+              u'Christian', u'Lucie', u'Alexander', u'Louis']
+LASTNAMES = [u'Almer', u'Lauener', u'Burgener', u'Rey', u'Kaufmann',
+             u'Imboden', u'Knubel', u'Devouassoud', u'Zurbriggen',
+             u'Gertsch']
+
+class Vocabulary:
+    """Words of a language drawn by a Zipf distribution: function words
+       first, then content words made of syllables."""
+
+    def __init__(self, lang, random, size=VOCABULARY_SIZE):
+        self.lang = lang
+        self.words = list(FUNCTION_WORDS[lang])
+
+        stems = set()
+        while len(stems) < size:
+            stems.add(u''.join(random.choice(SYLLABLES) for syllable
+                               in range(random.randint(2, 4))))
+        for stem in sorted(stems):
+            pos, lemma_suffix, surface_suffix, capitalized = \
+                random.choice(CONTENT_POS[lang])
+            surface = stem + surface_suffix
+            if capitalized:
+                surface = surface.capitalize()
+            self.words.append((stem + lemma_suffix, pos, surface))
+
+        # Cumulative weights of the ranks
+        self.cumulative = []
+        total = 0.0
+        for rank in range(len(self.words)):
+            total += 1.0 / (rank + 1) ** ZIPF_EXPONENT
+            self.cumulative.append(total)
+
+    def draw(self, random):
+        """Return a word (lemma, PoS tag, surface form)."""
+        return self.words[min(bisect(self.cumulative, random.random() *
+                                     self.cumulative[-1]),
+                              len(self.words) - 1)]
+
+class NamedEntities:
+    """Mountains and persons mentioned in a book, with the word ids of
+       their mentions."""
+
+    def __init__(self, random):
+        self.random = random
+        self.persons = []
+        for pid in range(1, PERSONS + 1):
+            self.persons.append((u'p' + str(pid), random.choice(FIRSTNAMES),
+                                 random.choice(LASTNAMES)))
+        self.mountain_spans = {} # stid -> spans (word ids separated by ,)
+        self.place_spans = {}
+        self.person_positions = {} # pid -> positions (lists of word ids)
+
+    def mountain(self):
+        """Return a mountain's stid and the words of its name."""
+        stid = self.random.randint(1, len(MOUNTAINS))
+        return (str(stid), MOUNTAINS[stid - 1].split(' '))
+
+    def person(self):
+        """Return a person's pid and the words of its name."""
+        pid, firstname, lastname = self.random.choice(self.persons)
+        return (pid, [firstname, lastname])
+
+    def add_mountain(self, stid, word_ids):
+        self.mountain_spans.setdefault(stid, []).append(u','.join(word_ids))
+
+    def add_place(self, stid, word_ids):
+        self.place_spans.setdefault(stid, []).append(u','.join(word_ids))
+
+    def add_person(self, pid, word_ids):
+        self.person_positions.setdefault(pid, []).append(word_ids)
+
+    def xml_lines(self):
+        """Return lines of the NER file."""
+        lines = [u'<?xml version="1.0" encoding="utf-8"?>', u'<ner>',
+                 u'<geo>']
+        for g_type, spans in [('mountain', self.mountain_spans),
+                              ('place', self.place_spans)]:
+            for stid in sorted(spans, key=int):
+                for span in spans[stid]:
+                    lines.append(u'<g type="' + g_type + u'" stid="' +
+                                 stid + u'" span="' + span + u'"/>')
+        lines.append(u'</geo>')
+        lines.append(u'<persons>')
+        for pid, firstname, lastname in self.persons:
+            if pid not in self.person_positions:
+                continue
+            lines.append(u'<person id="' + pid + u'">')
+            lines.append(u'<firstname>' + escape(firstname) +
+                         u'</firstname>')
+            lines.append(u'<lastname>' + escape(lastname) + u'</lastname>')
+            for positions in self.person_positions[pid]:
+                lines.append(u'<positions>' +
+                             u''.join(u'<position>' + position +
+                                      u'</position>'
+                                      for position in positions) +
+                             u'</positions>')
+            lines.append(u'</person>')
+        lines.append(u'</persons>')
+        lines.append(u'</ner>')
+        return lines
+
+class BookGenerator:
+    """Writes the year books (and NER files) of a collection."""
+
+    def __init__(self, articles=ARTICLES, sentences=SENTENCES,
+                 words=WORDS, seed=SEED):
+        self.articles = articles
+        self.sentences = sentences
+        self.words = words
+        self.seed = seed
+        random = Random(seed)
+        self.vocabularies = {
+                             DE_LANG : Vocabulary(DE_LANG, random),
+                             FR_LANG : Vocabulary(FR_LANG, random)
+                            }
+
+        # Numbers of elements written
+        self.counts = {'books' : 0, 'articles' : 0, 'sentences' : 0,
+                       'words' : 0, 'facts' : 0}
+
+    def _sentence_words(self, lang, random, named_entities):
+        """Return words (lemma, PoS tag, surface form) of a sentence and
+           its entities (kind, id, index of their first word, number of
+           words)."""
+        vocabulary = self.vocabularies[lang]
+        words = [vocabulary.draw(random) for word in range(self.words)]
+        entities = []
+
+        kinds = []
+        dice = random.random()
+        if named_entities is not None and dice < FACT_RATE:
+            kinds = ['person', 'verb', 'mountain']
+            self.counts['facts'] += 1
+        elif named_entities is not None and dice < FACT_RATE + MENTION_RATE:
+            kinds = [random.choice(['person', 'mountain', 'place'])]
+
+        for kind in kinds:
+            if kind == 'verb':
+                entity_id = None
+                inserted = [random.choice(CANDIDATE_VERBS[lang])]
+            elif kind == 'person':
+                entity_id, names = named_entities.person()
+                inserted = [(name, 'NE', name) for name in names]
+            elif kind == 'mountain':
+                entity_id, names = named_entities.mountain()
+                inserted = [(name, 'NE', name) for name in names]
+            else:
+                entity_id = str(random.randint(len(MOUNTAINS) + 1,
+                                               len(MOUNTAINS) + len(PLACES)))
+                name = PLACES[int(entity_id) - len(MOUNTAINS) - 1]
+                inserted = [(name, 'NE', name)]
+
+            # Entities inserted before are moved behind the new words
+            index = random.randint(0, len(words))
+            for entity in entities:
+                if entity[2] >= index:
+                    entity[2] += len(inserted)
+            words[index:index] = inserted
+            if entity_id is not None:
+                entities.append([kind, entity_id, index, len(inserted)])
+
+        words.append(PUNCTUATION[lang])
+        return words, entities
+
+    def _article_lines(self, article_n, langs, random, named_entities,
+                       translation_of=None):
+        """Return lines of an article; the languages of its sentences
+           are drawn from the ones given."""
+        lines = []
+        if translation_of is None:
+            lines.append(u'<article n="' + article_n + u'">')
+        else:
+            lines.append(u'<article n="' + article_n +
+                         u'" translation-of="' + translation_of + u'">')
+        lang = langs[0]
+        title = u' '.join(self.vocabularies[lang].draw(random)[2]
+                          for word in range(3))
+        lines.append(u'<tocEntry title=' + quoteattr(title) + u'/>')
+        lines.append(u'<div>')
+
+        for sentence_no in range(1, self.sentences + 1):
+            if sentence_no % PARAGRAPH_SENTENCES == 1:
+                lines.append(u'<p>')
+            lang = random.choice(langs)
+            sentence_n = article_n + u'-' + str(sentence_no)
+            words, entities = self._sentence_words(lang, random,
+                                                   named_entities)
+            word_ns = [sentence_n + u'-' + str(word_no) for word_no
+                       in range(1, len(words) + 1)]
+
+            lines.append(u'<s n="' + sentence_n + u'" lang="' + lang +
+                         u'">')
+            for word_n, (lemma, pos, surface) in zip(word_ns, words):
+                lines.append(u'<w n="' + word_n + u'" lemma=' +
+                             quoteattr(lemma) + u' pos="' + pos + u'">' +
+                             escape(surface) + u'</w>')
+            lines.append(u'</s>')
+
+            for kind, entity_id, index, length in entities:
+                word_ids = word_ns[index:index + length]
+                if kind == 'mountain':
+                    named_entities.add_mountain(entity_id, word_ids)
+                elif kind == 'place':
+                    named_entities.add_place(entity_id, word_ids)
+                elif kind == 'person':
+                    named_entities.add_person(entity_id, word_ids)
+
+            self.counts['sentences'] += 1
+            self.counts['words'] += len(words)
+            if sentence_no % PARAGRAPH_SENTENCES == 0 or \
+               sentence_no == self.sentences:
+                lines.append(u'</p>')
+
+        lines.append(u'</div>')
+        lines.append(u'</article>')
+        self.counts['articles'] += 1
+        return lines
+
+    def _write(self, filepath, lines):
+        with open(filepath, 'w', encoding=ENCODING) as filehdl:
+            filehdl.write(u'\n'.join(lines) + u'\n')
+
+    def write_book(self, year, xml_dirpath):
+        """Write the book(s) of a year (and the NER files of translated
+           books)."""
+        # Every year on its own, so that years can be added later
+        random = Random(self.seed * 10000 + year)
+
+        if year < FIRST_TRANSLATED_YEAR:
+            lines = [u'<?xml version="1.0" encoding="utf-8"?>',
+                     u'<book id="' + str(year) + u'_' + MUL_LANG + u'">']
+            for article_no in range(1, self.articles + 1):
+                lines += self._article_lines(str(article_no),
+                                             [DE_LANG, FR_LANG], random,
+                                             None)
+            lines.append(u'</book>')
+            self._write(xml_dirpath + FILENAME_PREFIX + str(year) + '_' +
+                        MUL_LANG + XML_SUFFIX, lines)
+            self.counts['books'] += 1
+            return
+
+        for lang, other_lang in [(DE_LANG, FR_LANG), (FR_LANG, DE_LANG)]:
+            named_entities = NamedEntities(random)
+            lines = [u'<?xml version="1.0" encoding="utf-8"?>',
+                     u'<book id="' + str(year) + u'_' + lang + u'">']
+            for article_no in range(1, self.articles + 1):
+                lines += self._article_lines(str(article_no), [lang],
+                                             random, named_entities,
+                                             str(year) + u'_' + other_lang +
+                                             u':' + str(article_no))
+            lines.append(u'</book>')
+            filepath_base = xml_dirpath + FILENAME_PREFIX + str(year) + \
+                            '_' + lang
+            self._write(filepath_base + XML_SUFFIX, lines)
+            self._write(filepath_base + NER_SUBSTR + XML_SUFFIX,
+                        named_entities.xml_lines())
+            self.counts['books'] += 1
+
+def generate_collection(target_dirpath, year_range=YEAR_RANGE,
+                        articles=ARTICLES, sentences=SENTENCES, words=WORDS,
+                        seed=SEED):
+    """Write a collection into the target folder (laid out as tbta and
+       bergbest expect their working folder); return the numbers of
+       books, articles, sentences, words and candidate facts written."""
+    xml_dirpath = target_dirpath.rstrip(sep) + sep + SAC_XML_DIR
+    if not exists(xml_dirpath):
+        makedirs(xml_dirpath)
+
+    stopwords_filepath = target_dirpath.rstrip(sep) + sep + \
+                         STOPWORDS_FILENAME
+    if not exists(stopwords_filepath):
+        with open(stopwords_filepath, 'w', encoding=ENCODING) as filehdl:
+            filehdl.write(u'\n'.join(lemma for lemma, pos, surface
+                                     in FUNCTION_WORDS[DE_LANG][:4]) +
+                          u'\n')
+
+    generator = BookGenerator(articles, sentences, words, seed)
+    for year in year_range:
+        generator.write_book(year, xml_dirpath)
+
+    return generator.counts
+
+def main():
+
+    if len(sys.argv) < 2 or sys.argv[1] in ['-h', '--help']:
+        print('TBSYNTH: Write a synthetic Text+Berg SAC collection\n')
+        print(sys.argv[0] + ' <target folder> [from_year[-to_year]] ' +
+              '[--articles N] [--sentences N] [--words N] [--seed N]')
+        print('Defaults: ' + str(YEAR_RANGE[0]) + '-' +
+              str(YEAR_RANGE[-1]) + ', ' + str(ARTICLES) + ' articles ' +
+              'per book, ' + str(SENTENCES) + ' sentences per article, ' +
+              str(WORDS) + ' words per sentence')
+        sys.exit(0)
+
+    argv = list(sys.argv)
+    scale = {'articles' : ARTICLES, 'sentences' : SENTENCES,
+             'words' : WORDS, 'seed' : SEED}
+    for name in list(scale.keys()):
+        option = '--' + name
+        if option in argv[:-1]:
+            index = argv.index(option)
+            scale[name] = int(argv[index + 1])
+            del argv[index:index + 2]
+
+    year_range = YEAR_RANGE
+    if len(argv) > 2:
+        years = [int(year) for year in argv[2].split('-')]
+        year_range = range(years[0], years[-1] + 1)
+
+    counts = generate_collection(argv[1], year_range, **scale)
+    print('Written: ' + ', '.join(str(counts[name]) + ' ' + name for name
+                                  in ['books', 'articles', 'sentences',
+                                      'words', 'facts']))
+
+if __name__ == '__main__':
+	main()
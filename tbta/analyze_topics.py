@@ -0,0 +1,151 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Topic analytics of tbta on a model saved before: top terms of all
+   topics, prevalence of the topics per year and per decade, and
+   similarity between topics. The topic-word matrix is taken from the
+   model and the doc-topic matrix from fold-in inference (see
+   infer_topics; inferred first where missing), and everything is
+   computed on them as whole arrays. Prevalences and top terms are
+   written as CSV, the topic-topic similarity as .npy."""
+
+import csv
+from os import sys, sep, makedirs
+from os.path import exists, basename
+from time import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import tbta
+from tbta import ENCODING
+import infer_topics
+
+# Folder to hold the results of the analytics
+ANALYTICS_DIR = 'analytics_files' + sep
+
+# Number of top terms per topic
+TOP_TERMS = 20
+
+def topic_word_matrix(model):
+    """Return the topic-word distributions (topics by words)."""
+    topic_word = model.state.get_lambda()
+    return topic_word / topic_word.sum(axis=1)[:, np.newaxis]
+
+def top_terms(topic_word, topn=TOP_TERMS):
+    """Return word ids and weights of the top terms of all topics
+       (topics by topn, descending)."""
+    topn = min(topn, topic_word.shape[1])
+    rows = np.arange(topic_word.shape[0])[:, np.newaxis]
+
+    # Top terms unordered first, then only those sorted
+    term_ids = np.argpartition(-topic_word, topn - 1, axis=1)[:, :topn]
+    order = np.argsort(-topic_word[rows, term_ids], axis=1)
+    term_ids = term_ids[rows, order]
+    return term_ids, topic_word[rows, term_ids]
+
+def prevalence(doc_topic, groups):
+    """Return the distinct groups (e. g. years) and the mean topic
+       distribution of the documents of each (groups by topics)."""
+    labels, group_ids = np.unique(groups, return_inverse=True)
+    membership = csr_matrix((np.ones(len(groups)),
+                             (group_ids, np.arange(len(groups)))),
+                            shape=(len(labels), len(groups)))
+    sums = np.asarray(membership.dot(doc_topic))
+    counts = np.bincount(group_ids, minlength=len(labels))
+    return labels, sums / counts[:, np.newaxis]
+
+def topic_similarity(topic_word):
+    """Return cosine similarity between the topics' word distributions
+       (topics by topics)."""
+    norms = np.sqrt(np.einsum('ij,ij->i', topic_word, topic_word))
+    normalized = topic_word / norms[:, np.newaxis]
+    return normalized.dot(normalized.T)
+
+def read_years(index_filepath):
+    """Return year of each row of the doc-topic matrix."""
+    with open(index_filepath) as filehdl:
+        return np.array([int(line.split('\t', 1)[0]) for line in filehdl],
+                        dtype=np.int32)
+
+def write_prevalence(filepath, labels, prevalences):
+    """Write prevalences as CSV, a row per group."""
+    with open(filepath, 'wb') as filehdl:
+        writer = csv.writer(filehdl, lineterminator='\n')
+        writer.writerow(['period'] + ['topic_' + str(topic) for topic
+                                      in range(prevalences.shape[1])])
+        for label, row in zip(labels, prevalences):
+            writer.writerow([label] + ['%.6f' % share for share in row])
+
+def write_top_terms(filepath, dictionary, term_ids, weights):
+    """Write top terms as CSV: topic, then term and weight by rank (terms
+       encoded in UTF-8, quoted where needed)."""
+    with open(filepath, 'wb') as filehdl:
+        writer = csv.writer(filehdl, lineterminator='\n')
+        header = ['topic']
+        for rank in range(term_ids.shape[1]):
+            header += ['term_' + str(rank), 'weight_' + str(rank)]
+        writer.writerow(header)
+        for topic in range(term_ids.shape[0]):
+            row = [topic]
+            for term_id, weight in zip(term_ids[topic], weights[topic]):
+                row += [dictionary[term_id].encode(ENCODING),
+                        '%.6f' % weight]
+            writer.writerow(row)
+
+def main():
+
+    options, argv = tbta.get_options(sys.argv)
+    model_year_range, year_range, lang = infer_topics.get_arguments(argv)
+
+    tbta.create_caching_folders()
+    if not exists(ANALYTICS_DIR):
+        makedirs(ANALYTICS_DIR)
+
+    model, model_filepath = infer_topics.load_model(
+                                model_year_range, lang,
+                                options['load_checkpoint'])
+    if model is None:
+        print('No model (LdaModel or LdaMulticore) saved with the ' +
+              'current settings.')
+        sys.exit(1)
+
+    # Doc-topic matrix of an inference done before is reused
+    inference_filepath = infer_topics.inference_filepath(year_range, lang,
+                                                         model_filepath)
+    if not exists(inference_filepath + '_doctopic.npy') or \
+       not exists(inference_filepath + '_index.tsv'):
+        infer_topics.infer_collection(model, year_range, lang,
+                                      inference_filepath, options['jobs'],
+                                      options['store'])
+    doc_topic = np.load(inference_filepath + '_doctopic.npy',
+                        mmap_mode='r')
+    years = read_years(inference_filepath + '_index.tsv')
+
+    start_time = time()
+    topic_word = topic_word_matrix(model)
+    term_ids, weights = top_terms(topic_word)
+    year_labels, year_prevalence = prevalence(doc_topic, years)
+    decade_labels, decade_prevalence = prevalence(doc_topic,
+                                                  years // 10 * 10)
+    similarity = topic_similarity(topic_word)
+    seconds = time() - start_time
+
+    filepath_prefix = ANALYTICS_DIR + basename(inference_filepath)
+    write_top_terms(filepath_prefix + '_topterms.csv', model.id2word,
+                    term_ids, weights)
+    write_prevalence(filepath_prefix + '_prevalence_year.csv', year_labels,
+                     year_prevalence)
+    write_prevalence(filepath_prefix + '_prevalence_decade.csv',
+                     decade_labels, decade_prevalence)
+    np.save(filepath_prefix + '_similarity.npy',
+            similarity.astype(np.float32))
+
+    print('Topics: ' + str(topic_word.shape[0]) + ', words: ' +
+          str(topic_word.shape[1]) + ', articles: ' + str(len(years)))
+    print('Analytics (seconds): %.3f' % seconds)
+    print('Written to ' + filepath_prefix + '_*.')
+
+if __name__ == '__main__':
+	main()
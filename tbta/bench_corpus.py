@@ -0,0 +1,102 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Compare the binary CSR corpus of tbta (CsrCorpus) with gensim's
+   MmCorpus on a collection tbta has already prepared (see
+   bowmm_files/): throughput of writing, of reading (streaming all
+   documents) and of feeding LDA training."""
+
+from os import sys
+from os.path import exists
+from time import time
+
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models.ldamodel import LdaModel
+
+import tbta
+from tbta import BOWMM_DIR, WORDSIDS_DIR, CsrCorpus
+
+# Prefix of the corpora written by the benchmark
+BENCH_FILEPATH = BOWMM_DIR + 'bench_corpus'
+
+# Number of topics and iterations of the LDA training fed
+NUM_TOPICS = 20
+ITERATIONS = 50
+
+# Fixed seed, so that both trainings do the very same work
+RANDOM_STATE = 42
+
+def read_all(corpus):
+    """Stream all documents; return number of (word id, weight) pairs."""
+    number_of_pairs = 0
+    for doc in corpus:
+        number_of_pairs += len(doc)
+    return number_of_pairs
+
+def train(corpus, dictionary):
+    """Train LDA fed by the corpus given."""
+    return LdaModel(corpus=corpus, id2word=dictionary,
+                    num_topics=NUM_TOPICS, iterations=ITERATIONS,
+                    passes=1, random_state=RANDOM_STATE)
+
+def timed(function, *args):
+    """Return result and seconds of a call."""
+    start_time = time()
+    result = function(*args)
+    return result, time() - start_time
+
+def main():
+
+    year_range, lang = tbta.get_arguments(sys.argv)
+    identifier = tbta.collection_identifier(year_range, lang)
+    bowmm_filepath = BOWMM_DIR + identifier + '_bow.mm'
+    wordsids_filepath = WORDSIDS_DIR + identifier + '_wordsids.txt'
+    if not exists(bowmm_filepath) or not exists(wordsids_filepath):
+        print('No prepared collection ' + identifier + ' found ' +
+              '(run tbta.py on it first).')
+        sys.exit(1)
+
+    dictionary = Dictionary.load_from_text(wordsids_filepath)
+    docs = list(MmCorpus(bowmm_filepath))
+    number_of_pairs = sum(len(doc) for doc in docs)
+
+    results = {}
+    results['mm write'] = timed(MmCorpus.serialize, BENCH_FILEPATH + '.mm',
+                                docs)[1]
+    results['csr write'] = timed(CsrCorpus.serialize, BENCH_FILEPATH,
+                                 docs)[1]
+    results['csr from mm'] = timed(CsrCorpus.from_mm,
+                                   BENCH_FILEPATH + '.mm',
+                                   BENCH_FILEPATH)[1]
+    corpora = {'mm' : MmCorpus(BENCH_FILEPATH + '.mm'),
+               'csr' : CsrCorpus(BENCH_FILEPATH)}
+
+    for name in ['mm', 'csr']:
+        results[name + ' read'] = timed(read_all, corpora[name])[1]
+        results[name + ' LDA feed'] = timed(train, corpora[name],
+                                            dictionary)[1]
+
+    print('Number of docs:  ' + str(len(docs)))
+    print('Number of pairs: ' + str(number_of_pairs))
+    print('')
+    print('%-14s %10s %12s %14s' % ('step', 'seconds', 'docs/s',
+                                    'pairs/s'))
+    for step in ['mm write', 'csr write', 'csr from mm', 'mm read',
+                 'csr read', 'mm LDA feed', 'csr LDA feed']:
+        seconds = max(results[step], 1e-9)
+        print('%-14s %10.3f %12.0f %14.0f' % (step, seconds,
+                                              len(docs) / seconds,
+                                              number_of_pairs / seconds))
+
+    if [[(word_id, float(weight)) for word_id, weight in doc]
+        for doc in corpora['csr']] == [[(word_id, float(weight))
+                                        for word_id, weight in doc]
+                                       for doc in docs]:
+        print('Same documents read from both.')
+    else:
+        print('Documents differ!')
+        sys.exit(1)
+
+if __name__ == '__main__':
+	main()
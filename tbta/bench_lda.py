@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Benchmark LDA training on a collection tbta has already prepared
+   (see bowmm_files/): wall-clock time, throughput and final perplexity
+   of LdaModel against LdaMulticore with different numbers of workers."""
+
+from os import sys
+from os.path import exists
+from time import time
+
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models.ldamodel import LdaModel
+from gensim.models.ldamulticore import LdaMulticore
+
+import tbta
+from tbta import BOWMM_DIR, WORDSIDS_DIR, NUM_TOPICS, ITERATIONS, \
+                 LDA_CHUNKSIZE
+
+# Numbers of LdaMulticore workers to compare
+WORKER_COUNTS = [1, 2, 4]
+
+# Fixed seed, so that all runs start from the same state
+RANDOM_STATE = 42
+
+# Number of topics if NUM_TOPICS is not set (-1)
+DEFAULT_NUM_TOPICS = 50
+
+def load_corpus(year_range, lang):
+    """Load the dictionary and bag-of-words corpus of the collection."""
+    identifier = tbta.collection_identifier(year_range, lang)
+    bowmm_filepath = BOWMM_DIR + identifier + '_bow.mm'
+    wordsids_filepath = WORDSIDS_DIR + identifier + '_wordsids.txt'
+    if not exists(bowmm_filepath) or not exists(wordsids_filepath):
+        print('No prepared collection ' + identifier + ' found ' +
+              '(run tbta.py on it first).')
+        sys.exit(1)
+
+    return (Dictionary.load_from_text(wordsids_filepath),
+            MmCorpus(bowmm_filepath))
+
+def train(corpus, dictionary, num_topics, workers):
+    """Train a model (LdaModel if workers is None) and return it with
+       the seconds taken."""
+    start_time = time()
+    if workers is None:
+        model = LdaModel(corpus=corpus, id2word=dictionary,
+                         num_topics=num_topics, iterations=ITERATIONS,
+                         chunksize=LDA_CHUNKSIZE, passes=1,
+                         random_state=RANDOM_STATE)
+    else:
+        model = LdaMulticore(corpus=corpus, id2word=dictionary,
+                             num_topics=num_topics, iterations=ITERATIONS,
+                             workers=workers, chunksize=LDA_CHUNKSIZE,
+                             passes=1, random_state=RANDOM_STATE)
+    return model, time() - start_time
+
+def main():
+
+    year_range, lang = tbta.get_arguments(sys.argv)
+    dictionary, corpus = load_corpus(year_range, lang)
+    number_of_docs = len(corpus)
+
+    num_topics = DEFAULT_NUM_TOPICS
+    if NUM_TOPICS != -1:
+        num_topics = NUM_TOPICS
+
+    print('Number of docs:   ' + str(number_of_docs))
+    print('Number of types:  ' + str(len(dictionary)))
+    print('Number of topics: ' + str(num_topics))
+    print('')
+    print('%-14s %10s %12s %12s' % ('model', 'seconds', 'docs/s',
+                                    'perplexity'))
+
+    for workers in [None] + WORKER_COUNTS:
+        model, seconds = train(corpus, dictionary, num_topics, workers)
+        perplexity = 2 ** -model.log_perplexity(corpus)
+        if workers is None:
+            name = 'LdaModel'
+        else:
+            name = 'Multicore x' + str(workers)
+        print('%-14s %10.2f %12.1f %12.1f' %
+              (name, seconds, number_of_docs / max(seconds, 1e-9),
+               perplexity))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Micro-benchmark of word normalization in tbta: words per second of
+   the former per-word code path against the WordNormalizer pipeline."""
+
+from os import sys
+from time import time
+from lxml import etree
+
+import tbta
+from tbta import STOPWORDS, POS_FILTER, SURFACE_TRIGGERS, ENCODING, \
+                 MIN_WORDLEN, SAC_XML_DIR, sac_filepath
+
+# Rounds over the words collected (to get measurable times)
+ROUNDS = 5
+
+def legacy_word(lemma, surface, pos, lang):
+    """Word normalization as done per word before WordNormalizer."""
+    word = None
+    try:
+        if tbta.WITH_POS_FILTER is False:
+            if tbta.WITH_LEMMATA:
+                word = lemma.lower()
+                if legacy_is_lemma_bogus(word):
+                    word = surface.lower()
+            if tbta.WITH_LEMMATA is False:
+                word = surface.lower()
+        elif tbta.WITH_POS_FILTER:
+            word = legacy_pos_filtered_word(lemma, surface, pos, lang)
+    except:
+        pass
+
+    if not word in STOPWORDS[lang] \
+    and word is not None and len(word) >= MIN_WORDLEN:
+        return legacy_normalize_word(word).encode(ENCODING)
+    return None
+
+def legacy_pos_filtered_word(lemma, surface, pos, lang):
+    try:
+        if pos in POS_FILTER[lang]:
+            if tbta.WITH_LEMMATA:
+                word = lemma.lower()
+                if legacy_is_lemma_bogus(word):
+                    return surface.lower()
+                else:
+                    return lemma.lower()
+            else:
+                return surface.lower()
+        else:
+            return None
+    except:
+        return None
+
+def legacy_is_lemma_bogus(lemma):
+    for bogus_symbol in SURFACE_TRIGGERS:
+        if bogus_symbol in lemma:
+            return True
+    return False
+
+def legacy_normalize_word(word_to_normalize):
+    return word_to_normalize.replace(u"ä","ae").replace(u"ö","oe"). \
+        replace(u"ü","ue").replace(u"ß","ss")
+
+def collect_words(year_range, lang):
+    """Return (lemma, surface, pos) of all words of the years given."""
+    words = []
+    for year in year_range:
+        try:
+            sac_xml = etree.parse(SAC_XML_DIR + sac_filepath(year, lang))
+        except IOError:
+            print('Skip (inexistent) yearbook ' + str(year) + '.')
+            continue
+        for sac_xml_word in sac_xml.xpath('.//s[@lang=\'' + lang +
+                                          '\']//w'):
+            words.append((sac_xml_word.attrib.get('lemma'),
+                          sac_xml_word.text,
+                          sac_xml_word.attrib.get('pos')))
+    return words
+
+def main():
+
+    year_range, lang = tbta.get_arguments(sys.argv)
+    words = collect_words(year_range, lang)
+    if not words:
+        print('No words found.')
+        sys.exit(1)
+
+    start_time = time()
+    for round_no in range(ROUNDS):
+        legacy_words = [legacy_word(lemma, surface, pos, lang)
+                        for lemma, surface, pos in words]
+    legacy_seconds = time() - start_time
+
+    # A new normalizer per round, i. e. its cache starts cold each time
+    start_time = time()
+    for round_no in range(ROUNDS):
+        normalize = tbta.WordNormalizer(lang).normalize
+        pipeline_words = [normalize(lemma, surface, pos)
+                          for lemma, surface, pos in words]
+    pipeline_seconds = time() - start_time
+
+    number_of_words = len(words) * ROUNDS
+    print('Words normalized: ' + str(number_of_words))
+    print('Before (per word):   %12.0f words/s' %
+          (number_of_words / legacy_seconds))
+    print('After (pipeline):    %12.0f words/s' %
+          (number_of_words / pipeline_seconds))
+
+    if legacy_words == pipeline_words:
+        print('Same words produced by both.')
+    else:
+        print('Words differ!')
+        sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Compare the tree-building and the streaming (iterparse) year book
+   reader of tbta regarding throughput and peak memory."""
+
+from os import sys
+from hashlib import md5
+from multiprocessing import Process, Queue
+from resource import getrusage, RUSAGE_SELF
+from time import time
+
+import tbta
+
+def read_years(year_range, lang, streaming, queue):
+    """Read all years given with one reader mode and put the
+       measurements into the queue (run in a fresh process each)."""
+    reader = tbta.YearbookReader(lang, streaming)
+    digest = md5()
+    number_of_articles = 0
+    number_of_tokens = 0
+
+    start_time = time()
+    for year in year_range:
+        try:
+            for article_no, article_word_list in reader.read_book(year):
+                number_of_articles += 1
+                number_of_tokens += len(article_word_list)
+                digest.update(' '.join(article_word_list) + '\n')
+        except IOError:
+            print('Skip (inexistent) yearbook ' + str(year) + '.')
+    seconds = time() - start_time
+
+    # ru_maxrss is given in kilobytes on Linux
+    queue.put((seconds, number_of_articles, number_of_tokens,
+               getrusage(RUSAGE_SELF).ru_maxrss, digest.hexdigest()))
+
+def main():
+
+    year_range, lang = tbta.get_arguments(sys.argv)
+    results = {}
+
+    for streaming in (False, True):
+        queue = Queue()
+        process = Process(target=read_years,
+                          args=(year_range, lang, streaming, queue))
+        process.start()
+        results[streaming] = queue.get()
+        process.join()
+
+    print('')
+    print('%-10s %10s %10s %12s %12s %14s' % ('reader', 'seconds',
+          'articles', 'tokens', 'tokens/s', 'peak RSS (MB)'))
+    for streaming in (False, True):
+        seconds, articles, tokens, max_rss, digest = results[streaming]
+        print('%-10s %10.2f %10d %12d %12.0f %14.1f' %
+              (streaming and 'iterparse' or 'parse', seconds, articles,
+               tokens, tokens / max(seconds, 1e-9), max_rss / 1024.0))
+
+    if results[False][4] == results[True][4]:
+        print('Same tokens read by both readers.')
+    else:
+        print('Tokens differ between readers!')
+        sys.exit(1)
+
+if __name__ == '__main__':
+	main()
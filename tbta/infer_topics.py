@@ -0,0 +1,205 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Fold-in inference of tbta: topic distributions of the articles of any
+   years (also of years the model wasn't trained on) by a model saved
+   before. The articles are inferred in batches, each as a whole (sparse
+   document-term matrix against the topic-word matrix), and written to
+   a memory-mapped float32 matrix (.npy, documents by topics) along with
+   an index of the articles (year and article number per row)."""
+
+from os import sys, sep, makedirs
+from os.path import exists, basename
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import psi
+
+import tbta
+from tbta import ModelCache, CHECKPOINT_DIR, ENCODING
+
+# Folder to hold the doc-topic matrices and their indices
+INFERENCE_DIR = 'inference_files' + sep
+
+# Number of documents inferred at once (memory grows with the number of
+# distinct words of the batch times the number of topics)
+BATCH_SIZE = 256
+
+# Seed of the random initialization of the topic distributions
+RANDOM_STATE = 42
+
+# Added to avoid divisions by zero (as gensim does)
+EPSILON = 1e-100
+
+def dirichlet_expectation(alpha):
+    """Return expectation of log theta for each row of alpha."""
+    return psi(alpha) - psi(np.sum(alpha, axis=1))[:, np.newaxis]
+
+def infer_batch(doc_term, exp_elog_beta, alpha, iterations,
+                gamma_threshold, random_state):
+    """Return topic distributions (variational E-step of LDA as done by
+       gensim's LdaModel.inference(), but for all documents of the
+       sparse doc-term matrix at once). Documents converged stay as
+       they are while the others are still updated."""
+    number_of_docs = doc_term.shape[0]
+    doc_term = doc_term.tocoo()
+    rows, cols, counts = doc_term.row, doc_term.col, doc_term.data
+    exp_elog_beta_t = exp_elog_beta.T
+
+    gamma = random_state.gamma(100., 1. / 100., (number_of_docs,
+                                                 len(alpha)))
+    exp_elog_theta = np.exp(dirichlet_expectation(gamma))
+    active = np.ones(number_of_docs, dtype=bool)
+
+    for iteration in range(iterations):
+        # Normalizer of the word-topic assignments of each (doc, word)
+        phinorm = np.einsum('ij,ij->i', exp_elog_theta[rows],
+                            exp_elog_beta_t[cols]) + EPSILON
+        weights = csr_matrix((counts / phinorm, (rows, cols)),
+                             shape=doc_term.shape)
+        new_gamma = alpha + exp_elog_theta * weights.dot(exp_elog_beta_t)
+
+        mean_change = np.mean(np.abs(new_gamma - gamma), axis=1)
+        gamma[active] = new_gamma[active]
+        exp_elog_theta[active] = np.exp(dirichlet_expectation(
+                                        gamma[active]))
+        active &= mean_change >= gamma_threshold
+        if not active.any():
+            break
+
+    return gamma / gamma.sum(axis=1)[:, np.newaxis]
+
+def read_articles(year_range, lang, articles_filepath, jobs, use_store):
+    """Read the articles of the years given; return them and their year
+       and article number."""
+    articles = tbta.ArticlesCorpus(articles_filepath)
+    index = []
+    try:
+        for year, book in tbta.read_books(year_range, lang,
+                                          tbta.read_book_articles, jobs,
+                                          use_store):
+            for article_no, article_word_list in book:
+                articles.append(article_word_list)
+                index.append((year, article_no))
+    finally:
+        articles.close()
+
+    return articles, index
+
+def infer_articles(model, articles, doc_topic):
+    """Write the topic distributions of all articles (by batches) into
+       the doc-topic matrix."""
+    dictionary = model.id2word
+    exp_elog_beta = np.exp(model.state.get_Elogbeta())
+    random_state = np.random.RandomState(RANDOM_STATE)
+
+    # Word id -> dictionary id (-1 if not in dictionary)
+    token_ids = np.array([dictionary.token2id.get(word.decode(ENCODING),
+                                                  -1)
+                          for word in articles.words],
+                         dtype=np.int64)
+    word_ids = articles.word_ids()
+    offsets = np.array(articles.offsets, dtype=np.int64)
+
+    for batch_start in range(0, len(articles), BATCH_SIZE):
+        batch_end = min(batch_start + BATCH_SIZE, len(articles))
+        batch_offsets = offsets[batch_start:batch_end + 1]
+        batch_token_ids = token_ids[word_ids[batch_offsets[0]:
+                                             batch_offsets[-1]]]
+        batch_docs = np.repeat(np.arange(batch_end - batch_start),
+                               np.diff(batch_offsets))
+        known = batch_token_ids >= 0
+
+        # Duplicates (same doc and word) are summed up to counts
+        doc_term = csr_matrix((np.ones(np.count_nonzero(known)),
+                               (batch_docs[known], batch_token_ids[known])),
+                              shape=(batch_end - batch_start,
+                                     len(dictionary)))
+        doc_term.sum_duplicates()
+        doc_topic[batch_start:batch_end] = infer_batch(doc_term,
+                                                       exp_elog_beta,
+                                                       model.alpha,
+                                                       model.iterations,
+                                                       model.gamma_threshold,
+                                                       random_state)
+
+def load_model(model_year_range, lang, checkpoint=''):
+    """Return model (or checkpoint of online training) saved before
+       with the current settings -- None if there isn't -- and its
+       filepath."""
+    model_identifier = tbta.collection_identifier(model_year_range, lang)
+    model_cache = ModelCache()
+    if checkpoint:
+        model_cache = ModelCache(CHECKPOINT_DIR)
+    model = model_cache.load(model_identifier, lang, checkpoint)
+    if model is None or not hasattr(model, 'state'):
+        return None, None
+    return model, model_cache.filepath(model_identifier, lang, checkpoint)
+
+def inference_filepath(year_range, lang, model_filepath):
+    """Return filepath prefix of the doc-topic matrix (and its index) of
+       the years given by the model given."""
+    return INFERENCE_DIR + tbta.collection_identifier(year_range, lang) + \
+           '_by_' + basename(model_filepath)[:-len('.model')]
+
+def infer_collection(model, year_range, lang, filepath_prefix, jobs=1,
+                     use_store=tbta.USE_STORE):
+    """Infer the articles of the years given; write doc-topic matrix and
+       index."""
+    if not exists(INFERENCE_DIR):
+        makedirs(INFERENCE_DIR)
+    articles, index = read_articles(year_range, lang,
+                                    filepath_prefix + '_articles.ids',
+                                    jobs, use_store)
+
+    doc_topic = np.lib.format.open_memmap(filepath_prefix +
+                                          '_doctopic.npy', mode='w+',
+                                          dtype=np.float32,
+                                          shape=(len(articles),
+                                                 model.num_topics))
+    infer_articles(model, articles, doc_topic)
+    doc_topic.flush()
+
+    # Row i of the doc-topic matrix is line i of the index
+    with open(filepath_prefix + '_index.tsv', 'w') as filehdl:
+        for year, article_no in index:
+            filehdl.write(str(year) + '\t' + article_no.encode(ENCODING) +
+                          '\n')
+
+    print('Inferred ' + str(len(articles)) + ' articles: ' +
+          filepath_prefix + '_doctopic.npy')
+
+def get_arguments(argv):
+    """Return year range of the model, year range to infer and language
+       code of the command line (without options)."""
+    if len(argv) < 3:
+        print(argv[0] + ' <model from_year[-to_year]> ' +
+              '<from_year[-to_year]> [lang code] [options]')
+        print('Example: ' + argv[0] + ' 1957-1980 1981-1990 de')
+        print('Example: ' + argv[0] + ' 1957-1980 1957-2011 de ' +
+              '--load-checkpoint 1970s')
+        sys.exit(0)
+    model_year_range, lang = tbta.get_arguments(argv[0:2] + argv[3:4])
+    year_range, lang = tbta.get_arguments(argv[0:1] + argv[2:4])
+    return model_year_range, year_range, lang
+
+def main():
+
+    options, argv = tbta.get_options(sys.argv)
+    model_year_range, year_range, lang = get_arguments(argv)
+
+    tbta.create_caching_folders()
+    model, model_filepath = load_model(model_year_range, lang,
+                                       options['load_checkpoint'])
+    if model is None:
+        print('No model (LdaModel or LdaMulticore) saved with the ' +
+              'current settings.')
+        sys.exit(1)
+
+    infer_collection(model, year_range, lang,
+                     inference_filepath(year_range, lang, model_filepath),
+                     options['jobs'], options['store'])
+
+if __name__ == '__main__':
+	main()
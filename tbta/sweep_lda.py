@@ -0,0 +1,193 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# h2m@access.uzh.ch
+
+"""Hyperparameter sweep of tbta: train a model for every combination of
+   the values in GRID and write fit time, perplexity and model path of
+   each to a results table. Every distinct dictionary (NO_BELOW,
+   NO_ABOVE) and corpus (bag-of-words or tf*idf) is built only once;
+   the fits run in a process pool sized to the memory budget.
+   Combinations found in the results table are skipped, so an
+   interrupted sweep continues where it stopped."""
+
+from os import sys, sep, makedirs
+from os.path import exists
+from itertools import product
+from multiprocessing import Pool
+from time import time
+
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models import TfidfModel
+
+import tbta
+
+# Values to combine (names of the tbta parameters)
+GRID = {
+         'NUM_TOPICS' : [50, 100],
+         'NO_BELOW' : [5],
+         'NO_ABOVE' : [0.5],
+         'ITERATIONS' : [200],
+         'USE_TFIDF' : [False, True],
+       }
+
+# Order of the parameters in the results table
+PARAMETERS = ['NUM_TOPICS', 'NO_BELOW', 'NO_ABOVE', 'ITERATIONS',
+              'USE_TFIDF']
+
+# Folder to hold dictionaries, corpora and results of sweeps
+SWEEP_DIR = 'sweep_files' + sep
+
+# Memory (in megabytes) all fits running at the same time may take
+MEMORY_BUDGET = 4096
+
+# Memory (in megabytes) a fit takes regardless of its size
+FIT_BASE_MEMORY = 200
+
+def config_filepath(identifier, config):
+    """Return filepath prefix of dictionary and corpora of a config."""
+    return SWEEP_DIR + identifier + '_nb=' + str(config['NO_BELOW']) + \
+           '_na=' + str(config['NO_ABOVE'])
+
+def configs():
+    """Return all combinations of the values in GRID."""
+    return [dict(zip(PARAMETERS, values)) for values
+            in product(*[GRID[parameter] for parameter in PARAMETERS])]
+
+def config_row(config):
+    """Return the table fields of a config."""
+    return [str(config[parameter]) for parameter in PARAMETERS]
+
+def finished_rows(results_filepath):
+    """Return config fields of the rows in the results table."""
+    rows = set()
+    if not exists(results_filepath):
+        return rows
+    with open(results_filepath) as filehdl:
+        next(filehdl) # Header
+        for line in filehdl:
+            rows.add(tuple(line.rstrip('\n').split('\t')[:len(PARAMETERS)]))
+    return rows
+
+def build_corpora(articles, identifier, configs_to_fit):
+    """Build dictionary and corpora of each distinct NO_BELOW, NO_ABOVE
+       (and tf*idf) once."""
+    built = set()
+    for config in configs_to_fit:
+        filepath = config_filepath(identifier, config)
+        if filepath not in built:
+            print('Create dictionary and bag-of-words ' + filepath + '.')
+            dictionary = articles.dictionary()
+            dictionary.filter_extremes(no_below=config['NO_BELOW'],
+                                       no_above=config['NO_ABOVE'])
+            dictionary.compactify()
+            dictionary.save(filepath + '.dict')
+            MmCorpus.serialize(filepath + '_bow.mm',
+                               articles.bow_corpus(dictionary))
+            built.add(filepath)
+        if config['USE_TFIDF'] and filepath + '_tfidf' not in built:
+            print('Create TF-IDF matrix ' + filepath + '.')
+            bow_corpus = MmCorpus(filepath + '_bow.mm')
+            tfidf = TfidfModel(bow_corpus, normalize=True)
+            MmCorpus.serialize(filepath + '_tfidf.mm', tfidf[bow_corpus])
+            built.add(filepath + '_tfidf')
+
+def fit_memory(config, number_of_types, number_of_docs):
+    """Return estimated memory (in megabytes) a fit takes: a few topics
+       by types arrays of floats (topic-word state, sufficient
+       statistics, their expectations)."""
+    num_topics = config['NUM_TOPICS']
+    if num_topics == -1:
+        num_topics = number_of_docs
+    return FIT_BASE_MEMORY + num_topics * number_of_types * 8 * 4 / 2**20
+
+def fit(job):
+    """Train (or load) the model of a config; return its table row."""
+    identifier, lang, config = job
+
+    # Parameters are read by tbta (training and model key) as globals
+    for parameter in PARAMETERS:
+        setattr(tbta, parameter, config[parameter])
+
+    filepath = config_filepath(identifier, config)
+    dictionary = Dictionary.load(filepath + '.dict')
+    corpus = MmCorpus(filepath + (config['USE_TFIDF'] and '_tfidf.mm' or
+                                  '_bow.mm'))
+    num_topics = config['NUM_TOPICS']
+    if num_topics == -1:
+        num_topics = len(corpus)
+
+    model_cache = tbta.ModelCache()
+    fit_seconds = 'NA' # Model was trained before
+    model = model_cache.load(identifier, lang)
+    if model is None:
+        start_time = time()
+        model = tbta.train_model(corpus, dictionary, num_topics)
+        fit_seconds = '%.2f' % (time() - start_time)
+        model_cache.save(model, identifier, lang)
+
+    perplexity = 'NA'
+    if hasattr(model, 'log_perplexity'):
+        perplexity = '%.2f' % 2 ** -model.log_perplexity(corpus)
+
+    return config_row(config) + [fit_seconds, perplexity,
+                                 model_cache.filepath(identifier, lang)]
+
+def main():
+
+    options, argv = tbta.get_options(sys.argv)
+    year_range, lang = tbta.get_arguments(argv)
+    identifier = tbta.collection_identifier(year_range, lang)
+
+    tbta.create_caching_folders()
+    if not exists(SWEEP_DIR):
+        makedirs(SWEEP_DIR)
+
+    results_filepath = SWEEP_DIR + identifier + '_sweep.tsv'
+    finished = finished_rows(results_filepath)
+    configs_to_fit = [config for config in configs()
+                      if tuple(config_row(config)) not in finished]
+    print('Configurations: ' + str(len(configs())) + ', finished: ' +
+          str(len(configs()) - len(configs_to_fit)))
+    if not configs_to_fit:
+        sys.exit(0)
+
+    articles_collection = tbta.ArticlesCollection(year_range, '', lang,
+                                                  jobs=options['jobs'],
+                                                  text_format='none',
+                                                  use_store=\
+                                                      options['store'])
+    build_corpora(articles_collection.articles, identifier, configs_to_fit)
+
+    # As many fits at the same time as the largest fit allows for
+    number_of_types = articles_collection.number_of_types
+    number_of_docs = articles_collection.number_of_docs
+    largest_fit_memory = max(fit_memory(config, number_of_types,
+                                        number_of_docs)
+                             for config in configs_to_fit)
+    processes = int(max(1, min(options['jobs'],
+                               MEMORY_BUDGET // largest_fit_memory)))
+    print('Fit ' + str(len(configs_to_fit)) + ' configurations with ' +
+          str(processes) + ' processes (about ' +
+          '%.0f' % largest_fit_memory + ' MB each at most).')
+
+    if not exists(results_filepath):
+        with open(results_filepath, 'w') as filehdl:
+            filehdl.write('\t'.join([parameter.lower() for parameter
+                                     in PARAMETERS] + ['fit_seconds',
+                                     'perplexity', 'model_path']) + '\n')
+
+    # Rows are written as soon as fits finish (kept on interruption)
+    pool = Pool(processes, maxtasksperchild=1)
+    try:
+        with open(results_filepath, 'a') as filehdl:
+            for row in pool.imap_unordered(fit, [(identifier, lang, config)
+                                                 for config
+                                                 in configs_to_fit]):
+                filehdl.write('\t'.join(row) + '\n')
+                filehdl.flush()
+                print('\t'.join(row))
+    finally:
+        pool.terminate()
+
+if __name__ == '__main__':
+	main()
@@ -3,11 +3,33 @@
 # h2m@access.uzh.ch
 
 from codecs import open
-from os import sep, sys, makedirs
-from os.path import exists
+from hashlib import md5
+from os import sep, sys, makedirs, listdir, remove, rename, stat, pardir, \
+               environ
+from os.path import exists, join, dirname, abspath
 from re import match
-import itertools
+from array import array
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+from subprocess import Popen, STDOUT
+from threading import Thread
+from time import time, sleep
+import zlib
 from lxml import etree
+import numpy as np
+
+try:
+    from Queue import Queue
+except ImportError: # Python 3
+    from queue import Queue
+
+# Columnar store of the year books, shared with bergbest
+sys.path.append(join(dirname(abspath(__file__)), pardir, 'tbstore'))
+import tbstore
+
+# Profiling of stages, shared with bergbest
+sys.path.append(join(dirname(abspath(__file__)), pardir, 'tbprofile'))
+import tbprofile
 
 from gensim.corpora import Dictionary, MmCorpus
 from gensim.models import TfidfModel
@@ -18,6 +40,8 @@ if MODEL == 'LdaMallet':
     from gensim.models.ldamallet import LdaMallet
 elif MODEL == 'HdpModel':
     from gensim.models.hdpmodel import HdpModel
+elif MODEL == 'LdaMulticore':
+    from gensim.models.ldamulticore import LdaMulticore
 else:
     from gensim.models.ldamodel import LdaModel # MODEL = 'LdaModel'
     
@@ -68,6 +92,13 @@ USE_TFIDF = False
 # Number of iterations to fullfil
 ITERATIONS = 200
 
+# Number of worker processes for MODEL 'LdaMulticore' 
+# (-1: number of cores less one)
+LDA_WORKERS = -1
+
+# Number of documents per training chunk for MODEL 'LdaMulticore'
+LDA_CHUNKSIZE = 2000
+
 POS_FILTER = { 
 #                DE_LANG : ['NN', 'NE', 'VVINF', 'VVFIN', 'VVIMP', 
 #                         'VVIZU', 'VAPP', 'VMPP', 'ADJA', 'ADJD'],
@@ -88,6 +119,17 @@ STOPWORDS[DE_LANG].pop()
 # If one of these signs are found in lemma, take surface form instead
 SURFACE_TRIGGERS = ['unk', '@ord@', '|', '@card@', '+', '#', '%']
 
+# Umlauts are transformed to an ASCII friendly form
+UMLAUT_TABLE = {
+                ord(u'ä') : u'ae',
+                ord(u'ö') : u'oe',
+                ord(u'ü') : u'ue',
+                ord(u'ß') : u'ss'
+               }
+
+# Maximal number of words memoized in normalization (emptied when full)
+NORMALIZE_CACHE_SIZE = 1000000
+
 # Years available in SAC corpus
 YEARS_ALLOWED = range(1864, 2012) # 1864 to 2011
 
@@ -104,11 +146,134 @@ BOWMM_DIR = 'bowmm_files' + sep
 # Folder to hold TF*IDF matrices for each document
 TFIDF_DIR = 'tfidf_files' + sep
 
+# Folder to hold the pre-processed articles of a collection (one per line)
+ARTICLES_DIR = 'articles_files' + sep
+
+# Folder to cache the pre-processed articles of each year book
+TOKEN_CACHE_DIR = 'token_cache' + sep
+
+# Use cached articles of year books (if their settings still match)
+USE_TOKEN_CACHE = True
+
+# Folder to hold unfiltered dictionary and bag-of-words of each year book
+# (reused when collections over growing year ranges are built)
+SEGMENTS_DIR = 'segment_files' + sep
+
+# Stream year books article by article (lxml iterparse) instead of
+# building the whole tree of a book in memory
+STREAMING_READER = True
+
+# Read year books from the columnar store (see tbstore), where converted
+USE_STORE = False
+
+# Folder of the columnar store
+STORE_DIR = tbstore.STORE_DIR
+
+# Feed models from a binary CSR copy (see CsrCorpus) of the Matrix 
+# Market files instead of parsing these
+USE_CSR_CORPUS = False
+
+# Number of documents read at once from a CSR corpus
+CSR_BLOCK_SIZE = 1024
+
 # Folder name for plain text output of articles
 TEXT_OUTPUT_DIR = 'text_output_dir'
 
+# Format of plain text output: 'files' (one file per article), 'year' or
+# 'run' (articles bulk written to one shard per year or per run, with 
+# an index of their offsets), or 'none'
+TEXT_OUTPUT_FORMAT = 'files'
+TEXT_OUTPUT_FORMATS = ['files', 'year', 'run', 'none']
+
+# Compress shards (gzip; every article is a gzip member of its own, so
+# single articles can still be read by offset)
+COMPRESS_TEXT_SHARDS = True
+
+# Filename of the index of articles written to shards
+TEXT_SHARDS_INDEX = 'index.tsv'
+
+# Indexes of text shards read (see text_shards_index()), by filepath
+TEXT_SHARDS_INDEXES = {}
+
+# Maximal number of articles waiting to be written out
+TEXT_OUTPUT_QUEUE_SIZE = 1000
+
+# Names the stages of the pipeline (see PipelineStage) are profiled by;
+# reading is further split into loading cached books (token_cache),
+# parse and tokenization
+PROFILED_STAGES = {
+                   'articles' : 'read',
+                   'segments' : 'read',
+                   'dictionary' : 'dictionary',
+                   'bow' : 'bow',
+                   'tfidf' : 'tfidf'
+                  }
+
+# Folder to hold trained models
+MODEL_DIR = 'model_files' + sep
+
+# Load trained models of the same collection, settings and 
+# hyperparameters instead of training them again
+USE_MODEL_CACHE = True
+
+# Folder to hold the checkpoints of online training, i. e. the models
+# after each period
+CHECKPOINT_DIR = 'checkpoint_files' + sep
+
+# Periods online training is done and checkpointed by
+ONLINE_PERIODS = ['year', 'decade']
+
+# Folder to hold the logs of the local cluster for distributed LDA
+DISTRIBUTED_DIR = 'distributed_files' + sep
+
+# Address of the Pyro4 name server of the local cluster
+DISTRIBUTED_NS_HOST = 'localhost'
+DISTRIBUTED_NS_PORT = 9090
+
+# Seconds to wait for the local cluster to get ready
+DISTRIBUTED_STARTUP_TIMEOUT = 60
+
+# Seconds to wait for the processes of the local cluster to terminate
+# before they are killed
+DISTRIBUTED_SHUTDOWN_TIMEOUT = 10
+
 PATH_TO_MALLET_BIN = '/home/hernani/uzh/master/modir/mallet-2.0.7/bin/mallet'
 
+# Command line options (--name [value]) and their defaults; the type of
+# the default tells whether an option is a flag or takes a value.
+OPTIONS = {
+            # Number of processes to read in year books with
+            'jobs' : 1,
+            # Reuse dictionary and bag-of-words of years seen before
+            'incremental' : False,
+            # Read year books from the columnar store
+            'store' : USE_STORE,
+            # Train LDA distributed over N local workers (0: not at all)
+            'distributed' : 0,
+            # Train model even if one with the same key was saved before
+            'retrain' : False,
+            # Only print the topics of the model saved before (no XML read)
+            'load_model' : False,
+            # Train online period by period (see ONLINE_PERIODS)
+            'online' : '',
+            # Log the perplexity of each period in online training (an
+            # extra pass over the period's documents)
+            'perplexity' : False,
+            # Only print the topics of a checkpoint of online training
+            # (period label like 1957 or 1950s; no XML read)
+            'load_checkpoint' : '',
+            # Format of plain text output (see TEXT_OUTPUT_FORMATS)
+            'text_output' : TEXT_OUTPUT_FORMAT,
+            # Write wall time, CPU time, peak memory and throughput of
+            # the stages to a JSON file
+            'profile' : '',
+            # Only show which stages of the pipeline would be run
+            'dry_run' : False,
+            # Show or remove cached year books
+            'cache_info' : False,
+            'cache_purge' : False,
+          }
+
 def sac_filepath(year, lang=DE_LANG):
     """Return SAC book filepath based on year and (optional) language 
        information."""
@@ -122,120 +287,1388 @@ def sac_filepath(year, lang=DE_LANG):
     
     return(base_prefix + '_' + lang + XML_SUFFIX)
 
+def collection_identifier(year_range, lang=DE_LANG):
+    """Collection id is important for the caching files and the file
+       naming of the corresponding files."""
+    
+    start_year = year_range[0]
+    end_year = year_range[-1]
+    
+    if start_year == end_year:
+        return str(start_year) + '_' + lang
+    
+    return str(start_year) + '-' + str(end_year) + '_' + lang
+
+def model_class():
+    """Return gensim class of the model used (see MODEL)."""
+    if MODEL == 'LdaMallet':
+        return LdaMallet
+    elif MODEL == 'HdpModel':
+        return HdpModel
+    elif MODEL == 'LdaMulticore':
+        return LdaMulticore
+    return LdaModel
+
+def show_topics(model):
+    """Print the topics of a model."""
+    
+    if MODEL in ['LdaModel', 'LdaMallet', 'LdaMulticore']:
+        topic_number = 0
+        for topic in model.show_topics(topics=TOPICS_DISPLAY, 
+                                     topn=WORDS_DISPLAY,
+                                     formatted=True):
+            topic_number += 1
+            print('Topic#' + str(topic_number) + ': ', topic)
+    else: # For MODEL 'HdpModel'
+        for topic in model.print_topics(topics=TOPICS_DISPLAY, \
+                           topn=WORDS_DISPLAY):
+            print topic
+
+def train_model(corpus, dictionary, num_topics, cluster=None):
+    """Train the model (see MODEL) on the corpus given and return it
+       (distributed if a started LdaCluster is given)."""
+    
+    if MODEL == 'LdaMallet':
+        return LdaMallet(PATH_TO_MALLET_BIN,
+                         corpus=corpus,
+                         num_topics=num_topics,
+                         id2word=dictionary,
+                         iterations=ITERATIONS)
+                        
+    elif MODEL == 'HdpModel':
+        return HdpModel(corpus, dictionary)
+    
+    elif MODEL == 'LdaMulticore':
+        print('Number of LDA workers:    ' + str(lda_workers()))
+        return LdaMulticore(corpus=corpus,
+                            id2word=dictionary,
+                            num_topics=num_topics,
+                            iterations=ITERATIONS,
+                            workers=lda_workers(),
+                            chunksize=LDA_CHUNKSIZE,
+                            passes=1)
+    
+    '''
+    More possible options below:
+                   chunksize=1,
+                   update_every=1,
+                   decay=0.5,
+    '''
+    return LdaModel(corpus=corpus,
+                    id2word=dictionary,
+                    num_topics=num_topics,
+                    iterations=ITERATIONS,
+                    update_every=1,
+                    chunksize=10,
+                    passes=1,
+                    distributed=cluster is not None,
+                    ns_conf=cluster and cluster.ns_conf)
+
+def lda_workers():
+    """Return number of worker processes to train LdaMulticore with."""
+    if LDA_WORKERS == -1:
+        return max(cpu_count() - 1, 1)
+    return LDA_WORKERS
+
+def book_source_stat(year, lang=DE_LANG):
+    """Return modification time and size of a book's XML file -- as 
+       recorded in the store if the XML file isn't there."""
+    filepath = sac_filepath(year, lang=lang)
+    
+    if not exists(SAC_XML_DIR + filepath):
+        book = tbstore.open_book(filepath, STORE_DIR, SAC_XML_DIR)
+        if book is not None:
+            return (book.meta['source_mtime'], book.meta['source_size'])
+    
+    xml_stat = stat(SAC_XML_DIR + filepath)
+    return (xml_stat.st_mtime, xml_stat.st_size)
+
+def read_book_articles(job):
+    """Read in a single book (also used in worker processes). Job is a
+       tuple of year, language and whether to use the store; return year
+       and the book's articles as (article number, words) -- or None if
+       the book can't be read --, and the measurements of reading (see
+       read_books())."""
+    year, lang, use_store = job
+    reader = YearbookReader(lang, use_store=use_store)
+    token_cache = TokenCache()
+    articles = None
+    measurements = []
+    
+    # Not every single yearbook is available (the cache key is made of
+    # the book's file as well).
+    try:
+        if USE_TOKEN_CACHE:
+            token_cache.filepath(year, lang)
+    except OSError:
+        return (year, None, [])
+    
+    # Unreadable cache entries are ignored (the book is read instead)
+    if USE_TOKEN_CACHE:
+        start_time = time()
+        start_cpu = tbprofile.thread_cpu_seconds()
+        try:
+            articles = token_cache.load(year, lang)
+        except (IOError, OSError, ValueError) as error:
+            print('Warning: ignore cache entry of yearbook ' + str(year) +
+                  ' (' + str(error) + ').')
+        counters = {'misses' : 1}
+        if articles is not None:
+            counters = {'hits' : 1, 'articles' : len(articles),
+                        'tokens' : number_of_tokens(articles)}
+        measurements.append(('token_cache', time() - start_time,
+                             tbprofile.thread_cpu_seconds() - start_cpu,
+                             counters))
+    
+    cached = articles is not None
+    if not cached:
+        start_time = time()
+        start_cpu = tbprofile.thread_cpu_seconds()
+        try:
+            articles = list(reader.read_book(year))
+        except (IOError, OSError, etree.XMLSyntaxError):
+            return (year, None, [])
+        
+        # Parsing is all but the normalization of the words
+        stats = reader.stats
+        measurements.append(('parse', 
+                             time() - start_time - 
+                             stats['tokenization_seconds'],
+                             tbprofile.thread_cpu_seconds() - start_cpu - 
+                             stats['tokenization_cpu_seconds'],
+                             {'articles' : len(articles),
+                              'sentences' : stats['sentences'],
+                              'words' : stats['words']}))
+        measurements.append(('tokenization', stats['tokenization_seconds'],
+                             stats['tokenization_cpu_seconds'],
+                             {'words' : stats['words'],
+                              'tokens' : number_of_tokens(articles)}))
+    
+    # The book is kept where it can't be cached
+    if USE_TOKEN_CACHE and not cached:
+        try:
+            token_cache.save(year, lang, articles)
+        except (IOError, OSError) as error:
+            print('Warning: yearbook ' + str(year) + ' not cached (' + 
+                  str(error) + ').')
+    
+    return (year, articles, measurements)
+
+def number_of_tokens(articles):
+    """Return number of words over the articles given."""
+    return sum(len(article_word_list) for article_no, article_word_list 
+               in articles)
+
+def read_book_segment(job):
+    """Make sure the segment (unfiltered dictionary and bag-of-words) of
+       a single book is saved (also used in worker processes); job is
+       the same as for read_book_articles(). Return year and filepath of 
+       the segment (without suffix) along with the articles read in (if
+       the segment is new) -- or None if the book can't be read --, and
+       the measurements of reading (see read_books())."""
+    year, lang, use_store = job
+    
+    # Segments are named like cached books, i. e. by the settings they
+    # depend on.
+    try:
+        segment_filepath = SEGMENTS_DIR + str(year) + '_' + lang + '_' + \
+                           TokenCache().key(year, lang)
+    except OSError:
+        return (year, None, [])
+    
+    if exists(segment_filepath + '.dict'):
+        print('Reuse segment of yearbook ' + str(year) + '.')
+        return (year, (segment_filepath, []), [])
+    
+    year, articles, measurements = read_book_articles(job)
+    if articles is None:
+        return (year, None, measurements)
+    
+    dictionary = Dictionary()
+    bow_corpus = [dictionary.doc2bow(article_word_list, allow_update=True)
+                  for article_no, article_word_list in articles]
+    
+    # Dictionary is saved last, it marks the segment as complete.
+    MmCorpus.serialize(segment_filepath + '.mm', bow_corpus)
+    dictionary.save(segment_filepath + '.dict')
+    
+    return (year, (segment_filepath, articles), measurements)
+
+def text_shards_index(text_output_dirpath):
+    """Return the offset index of the text shards of a folder as a dict
+       (year, lang, article number -> shard filename, offset, length);
+       it is read once, and again only where it was written since."""
+    index_filepath = text_output_dirpath + sep + TEXT_SHARDS_INDEX
+    index_stat = stat(index_filepath)
+    version = (index_stat.st_mtime, index_stat.st_size)
+    
+    cached = TEXT_SHARDS_INDEXES.get(index_filepath)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    index = {}
+    with open(index_filepath, 'r', ENCODING) as index_filehdl:
+        for line in index_filehdl:
+            fields = line.rstrip('\n').split('\t')
+            index[tuple(fields[:3])] = (fields[3], int(fields[4]),
+                                        int(fields[5]))
+    TEXT_SHARDS_INDEXES[index_filepath] = (version, index)
+    return index
+
+def read_article_text(text_output_dirpath, year, lang, article_no):
+    """Return plain text of an article written to text shards, found by
+       the offset index of the shards."""
+    location = text_shards_index(text_output_dirpath).get(
+                   (str(year), lang, article_no))
+    if location is None:
+        return None
+    shard_filename, offset, length = location
+    
+    with open(text_output_dirpath + sep + shard_filename, 'rb') as filehdl:
+        filehdl.seek(offset)
+        text = filehdl.read(length)
+    if shard_filename.endswith('.gz'):
+        text = zlib.decompress(text, 16 + zlib.MAX_WBITS)
+    
+    return text.rstrip(b'\n')
+
+def read_books(year_range, lang, read_book_function, jobs=1,
+               use_store=USE_STORE, profiler=None):
+    """Yield year and result of the read function given (see 
+       read_book_articles()) for all years. With several jobs, books
+       are read in a pool of processes, but still yielded in year 
+       order. The measurements of the readers -- stage, wall and CPU 
+       time, counters of loading cached books, parsing and tokenizing 
+       -- are added to the profiler (if given)."""
+    pool = None
+    book_jobs = [(year, lang, use_store) for year in year_range]
+    
+    if jobs > 1:
+        pool = Pool(processes=jobs)
+        books = pool.imap(read_book_function, book_jobs)
+    else:
+        books = (read_book_function(job) for job in book_jobs)
+    
+    try:
+        for year, book, measurements in books:
+            if book is None:
+                print('Skip (inexistent) yearbook ' + str(year) + '.')
+                continue
+            if profiler is not None:
+                for name, seconds, cpu_seconds, counters in measurements:
+                    profiler.stage(name).add(seconds, cpu_seconds, 
+                                             **counters)
+            yield (year, book)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def open_corpus(mm_filepath):
+    """Return corpus of a Matrix Market file -- streamed from its CSR 
+       copy if USE_CSR_CORPUS (converted where missing or older)."""
+    if not USE_CSR_CORPUS:
+        return MmCorpus(mm_filepath)
+    
+    csr_filepath = mm_filepath[:-len('.mm')]
+    if not exists(csr_filepath + '.indptr') or \
+       stat(csr_filepath + '.indptr').st_mtime < stat(mm_filepath).st_mtime:
+        CsrCorpus.from_mm(mm_filepath, csr_filepath)
+    return CsrCorpus(csr_filepath)
+
+def merge_dictionaries(dictionary, other):
+    """Merge tokens and counts of the other dictionary into dictionary. 
+       New tokens get ids in the order of their ids in other -- just as 
+       if the other's documents had been added to dictionary itself."""
+    
+    for token, other_id in sorted(other.token2id.items(), 
+                                  key=lambda item: item[1]):
+        if token not in dictionary.token2id:
+            dictionary.token2id[token] = len(dictionary.token2id)
+        token_id = dictionary.token2id[token]
+        dictionary.dfs[token_id] = dictionary.dfs.get(token_id, 0) + \
+                                   other.dfs.get(other_id, 0)
+        dictionary.cfs[token_id] = dictionary.cfs.get(token_id, 0) + \
+                                   other.cfs.get(other_id, 0)
+    
+    dictionary.num_docs += other.num_docs
+    dictionary.num_pos += other.num_pos
+    dictionary.num_nnz += other.num_nnz
+    dictionary.id2token = {} # Rebuilt lazily by gensim
+
+class TokenCache:
+    """Class which caches the articles (as lists of words) of single 
+       year books on disk. The key of a book covers all settings its 
+       words depend on, so changed settings never hit a stale entry."""
+    
+    def __init__(self, dirpath=TOKEN_CACHE_DIR):
+        self.dirpath = dirpath
+    
+    def key(self, year, lang):
+        """Return key of the settings a book's articles depend on."""
+        source_mtime, source_size = book_source_stat(year, lang)
+        settings = [int(year), lang, WITH_LEMMATA, WITH_POS_FILTER, 
+                    POS_FILTER[lang], MIN_WORDLEN, SURFACE_TRIGGERS,
+                    STOPWORDS[lang], source_mtime, source_size]
+        
+        return md5(repr(settings).encode(ENCODING)).hexdigest()
+    
+    def filepath(self, year, lang):
+        """Return filepath of a book's cache entry."""
+        return self.dirpath + str(year) + '_' + lang + '_' + \
+               self.key(year, lang) + '.txt'
+    
+    def load(self, year, lang):
+        """Return list of (article number, words) of a book, or None if
+           it isn't cached (with the current settings)."""
+        filepath = self.filepath(year, lang)
+        if not exists(filepath):
+            return None
+        
+        print('Load yearbook ' + str(year) + ' from cache.')
+        articles = []
+        with open(filepath, 'rb') as filehdl:
+            for line in filehdl:
+                fields = line.rstrip(b'\n').split(b'\t')
+                articles.append((fields[0].decode(ENCODING), fields[1:]))
+        
+        return articles
+    
+    def save(self, year, lang, articles):
+        """Save list of (article number, words) of a book."""
+        filepath = self.filepath(year, lang)
+        
+        # Written under a temporary name first; interrupted runs must
+        # not leave incomplete entries.
+        with open(filepath + '.tmp', 'wb') as filehdl:
+            for article_no, article_word_list in articles:
+                filehdl.write(b'\t'.join([article_no.encode(ENCODING)] +
+                                         article_word_list) + b'\n')
+        rename(filepath + '.tmp', filepath)
+    
+    def entries(self):
+        """Return list of (filename, year, lang, size, up to date) of 
+           the books cached."""
+        entries = []
+        
+        for filename in sorted(listdir(self.dirpath)):
+            if not filename.endswith('.txt'):
+                continue
+            year, lang, key = filename[:-len('.txt')].split('_')
+            try:
+                up_to_date = key == self.key(year, lang)
+            except OSError:
+                up_to_date = False # Source year book is gone
+            entries.append((filename, year, lang,
+                            stat(self.dirpath + filename).st_size,
+                            up_to_date))
+            
+        return entries
+    
+    def purge(self):
+        """Remove all books cached; return number of files removed."""
+        filenames = listdir(self.dirpath)
+        for filename in filenames:
+            remove(self.dirpath + filename)
+        
+        return len(filenames)
+
+class YearbookReader:
+    """Class which reads SAC year books and turns their articles into
+       lists of (normalized) words."""
+    
+    def __init__(self, lang=DE_LANG, streaming=STREAMING_READER,
+                 use_store=USE_STORE):
+        self.lang = lang
+        self.streaming = streaming
+        self.use_store = use_store
+        self.normalizer = WordNormalizer(lang)
+        
+        # Sentences and words read, time spent normalizing words
+        self.stats = {'sentences' : 0, 'words' : 0,
+                      'tokenization_seconds' : 0.0,
+                      'tokenization_cpu_seconds' : 0.0}
+    
+    def read_book(self, year):
+        """Read in a single book and yield article number and word list
+           of each of its articles."""
+        filepath = sac_filepath(year, lang=self.lang)
+        
+        if self.use_store:
+            book = tbstore.open_book(filepath, STORE_DIR, SAC_XML_DIR)
+            if book is not None:
+                print('Read in yearbook ' + str(year) + ' from store.')
+                for article in self._stored_book_articles(book):
+                    yield article
+                return
+        
+        print('Read in yearbook ' + str(year) + '.')
+        
+        # For each article
+        for sac_xml_article in self._book_articles(SAC_XML_DIR + 
+                                                   filepath):
+            yield (sac_xml_article.attrib['n'],
+                   self._article_words(sac_xml_article))
+    
+    def _stored_book_articles(self, book):
+        """Yield article number and word list of each article of a book
+           in the store. Words are normalized once per distinct (lemma,
+           surface form, PoS) ids, and articles are sliced out of the
+           book's word columns."""
+        try:
+            lang_id = book.langs.index(self.lang)
+        except ValueError:
+            lang_id = None # No sentences in the language wanted
+        
+        # Words of the sentences in the language wanted
+        word_indices = np.zeros(0, dtype=np.int64)
+        if lang_id is not None:
+            sentence_lengths = np.diff(book.sentence_offsets)
+            word_indices = np.flatnonzero(np.repeat(book.sentence_lang == 
+                                                    lang_id,
+                                                    sentence_lengths))
+        
+        words = []
+        word_keys = np.zeros(0, dtype=np.int64)
+        start_time = time()
+        start_cpu = tbprofile.thread_cpu_seconds()
+        if len(word_indices) > 0:
+            keys, word_keys = np.unique(
+                np.stack([book.word_lemma[word_indices],
+                          book.word_token[word_indices],
+                          book.word_pos[word_indices]], axis=1),
+                axis=0, return_inverse=True)
+            words = [self.normalizer.normalize(
+                         book.value('lemmata', lemma_id),
+                         book.value('tokens', token_id),
+                         book.value('pos_tags', pos_id))
+                     for lemma_id, token_id, pos_id in keys.tolist()]
+        self.stats['tokenization_seconds'] += time() - start_time
+        self.stats['tokenization_cpu_seconds'] += \
+            tbprofile.thread_cpu_seconds() - start_cpu
+        self.stats['words'] += len(word_indices)
+        if lang_id is not None:
+            self.stats['sentences'] += int(np.count_nonzero(
+                                           book.sentence_lang == lang_id))
+        
+        for article_index in range(book.number_of_articles()):
+            article_start, article_end = book.sentence_offsets[
+                book.article_offsets[article_index:article_index + 2]]
+            start, end = np.searchsorted(word_indices, 
+                                         [article_start, article_end])
+            article_words = [words[word_key] for word_key 
+                             in word_keys[start:end].tolist()]
+            yield (book.article_n[article_index],
+                   [word for word in article_words if word is not None])
+    
+    def _book_articles(self, xml_filepath):
+        """Yield the <article> elements of a book, either from a fully 
+           built tree or streamed one by one."""
+        if not self.streaming:
+            sac_xml = etree.parse(xml_filepath)
+            for sac_xml_article in sac_xml.xpath('.//article'):
+                yield sac_xml_article
+            return
+        
+        # Only whole articles are kept in memory: once an article has
+        # been consumed, it is cleared and dropped from its parent.
+        for event, sac_xml_article in etree.iterparse(xml_filepath,
+                                                      events=('end',),
+                                                      tag='article'):
+            yield sac_xml_article
+            sac_xml_article.clear()
+            while sac_xml_article.getprevious() is not None:
+                del sac_xml_article.getparent()[0]
+    
+    def _article_words(self, sac_xml_article):
+        """Return list of words of an article (of the sentences in the
+           language wanted)."""
+        article_word_list = []
+        sac_xml_sentences_list = \
+            sac_xml_article.xpath('.//s[@lang=\'' + \
+                                  self.lang + '\']')
+        start_time = time()
+        start_cpu = tbprofile.thread_cpu_seconds()
+        number_of_words = 0
+        # For each sentence (in the article)
+        for sac_xml_sentence in sac_xml_sentences_list:
+            # For each word (in the sentence of the article)
+            for sac_xml_word in sac_xml_sentence.iter('w'):
+                attrib = sac_xml_word.attrib
+                word = self.normalizer.normalize(attrib.get('lemma'),
+                                                 sac_xml_word.text,
+                                                 attrib.get('pos'))
+                number_of_words += 1
+                if word is not None:
+                    article_word_list.append(word)
+        self.stats['tokenization_seconds'] += time() - start_time
+        self.stats['tokenization_cpu_seconds'] += \
+            tbprofile.thread_cpu_seconds() - start_cpu
+        self.stats['sentences'] += len(sac_xml_sentences_list)
+        self.stats['words'] += number_of_words
+        return article_word_list
+
+class ModelCache:
+    """Class which saves trained models on disk. The key of a model
+       covers the collection, the pre-processing settings and the
+       hyperparameters, so a model is only reused where training it 
+       again would be done with the very same input and settings. 
+       Models of online training are saved per period (see 
+       ArticlesCollection.train_online())."""
+    
+    def __init__(self, dirpath=MODEL_DIR):
+        self.dirpath = dirpath
+    
+    def settings(self, identifier, lang):
+        """Return settings a model depends on."""
+        settings = [identifier, WITH_LEMMATA, WITH_POS_FILTER,
+                    POS_FILTER[lang], MIN_WORDLEN, SURFACE_TRIGGERS,
+                    STOPWORDS[lang], NO_BELOW, NO_ABOVE, USE_TFIDF, MODEL,
+                    NUM_TOPICS, ITERATIONS]
+        if MODEL == 'LdaMulticore':
+            settings.append(LDA_CHUNKSIZE)
+        
+        return settings
+    
+    def key(self, identifier, lang):
+        """Return key of the settings a model depends on."""
+        return md5(repr(self.settings(identifier, lang)).\
+                   encode(ENCODING)).hexdigest()
+    
+    def filepath(self, identifier, lang, period=''):
+        """Return filepath of a model (of a period)."""
+        if period:
+            period = '_' + period
+        return self.dirpath + identifier + '_' + MODEL + '_' + \
+               self.key(identifier, lang) + period + '.model'
+    
+    def exists(self, identifier, lang, period=''):
+        """Tell whether a model was saved completely (its settings file
+           is written last)."""
+        return exists(self.filepath(identifier, lang, period) + 
+                      '.settings')
+    
+    def load(self, identifier, lang, period=''):
+        """Return the model saved, or None if there is none (with the
+           current settings)."""
+        if not self.exists(identifier, lang, period):
+            return None
+        
+        filepath = self.filepath(identifier, lang, period)
+        print('Load model ' + filepath + '.')
+        return model_class().load(filepath)
+    
+    def save(self, model, identifier, lang, period=''):
+        """Save a model along with its settings."""
+        filepath = self.filepath(identifier, lang, period)
+        model.save(filepath)
+        with open(filepath + '.settings', 'w', ENCODING) as filehdl:
+            filehdl.write(repr(self.settings(identifier, lang)) + u'\n')
+        print('Saved model ' + filepath + '.')
+
+class TextOutput:
+    """Class which writes out the plain text (words) of articles on a 
+       background thread, so writing overlaps with reading. Articles are
+       either written to a file each or bulk written to shards (one per
+       year or per run) along with an index of their offsets. What was
+       written is reported by the main thread, on closing."""
+    
+    def __init__(self, text_output_dirpath, lang=DE_LANG,
+                 text_format=TEXT_OUTPUT_FORMAT):
+        self.text_output_dirpath = text_output_dirpath
+        self.lang = lang
+        self.text_format = text_format
+        self.error = None
+        self.number_of_articles = 0 # Written out so far
+        self._shard_filename = None
+        self._shard_filehdl = None
+        self._index_filehdl = None
+        self._queue = Queue(maxsize=TEXT_OUTPUT_QUEUE_SIZE)
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def write(self, year, article_no, article_word_list):
+        """Queue an article to be written out."""
+        if self.text_format != 'none':
+            self._queue.put((year, article_no, article_word_list))
+    
+    def close(self):
+        """Wait until all articles are written out."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.number_of_articles:
+            print('Wrote ' + str(self.number_of_articles) + 
+                  ' articles to ' + self.text_output_dirpath + '.')
+    
+    def _run(self):
+        """Write out articles queued (on the background thread)."""
+        try:
+            while True:
+                article = self._queue.get()
+                if article is None:
+                    break
+                if self.text_format == 'files':
+                    self._write_file(*article)
+                else:
+                    self._write_shard(*article)
+                self.number_of_articles += 1
+        except Exception as error:
+            self.error = error
+            
+            # Keep on emptying the queue, writers must not block.
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if self._shard_filehdl is not None:
+                self._shard_filehdl.close()
+            if self._index_filehdl is not None:
+                self._index_filehdl.close()
+    
+    def _write_file(self, year, article_no, article_word_list):
+        """Write out an article to a file of its own."""
+        out_filename = str(year) + '-' + str(self.lang) + '-' \
+                       + article_no + '.txt'
+        out_filepath = self.text_output_dirpath + sep + out_filename
+        out_filehdl = open(out_filepath, 'w')
+        out_filehdl.write(' '.join(article_word_list))
+        out_filehdl.close()
+    
+    def _write_shard(self, year, article_no, article_word_list):
+        """Append an article to its shard and index it."""
+        shard_filename = self.lang + '.txt'
+        if self.text_format == 'year':
+            shard_filename = str(year) + '-' + shard_filename
+        if COMPRESS_TEXT_SHARDS:
+            shard_filename += '.gz'
+        
+        if shard_filename != self._shard_filename:
+            if self._shard_filehdl is not None:
+                self._shard_filehdl.close()
+            self._shard_filename = shard_filename
+            self._shard_filehdl = open(self.text_output_dirpath + sep + 
+                                       shard_filename, 'wb')
+        if self._index_filehdl is None:
+            self._index_filehdl = open(self.text_output_dirpath + sep + 
+                                       TEXT_SHARDS_INDEX, 'w', ENCODING)
+        
+        text = b' '.join(article_word_list) + b'\n'
+        if COMPRESS_TEXT_SHARDS:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 
+                                          16 + zlib.MAX_WBITS)
+            text = compressor.compress(text) + compressor.flush()
+        
+        offset = self._shard_filehdl.tell()
+        self._shard_filehdl.write(text)
+        self._index_filehdl.write('\t'.join([str(year), self.lang, 
+                                              article_no, shard_filename,
+                                              str(offset), 
+                                              str(len(text))]) + '\n')
+
+class WordNormalizer:
+    """Class which turns lemma, surface form and PoS tag of a word into
+       the (normalized, encoded) word used for LDA -- or None if the word
+       is to be dropped. Lookups are precompiled to sets and a translate
+       table, and results are memoized, as most words recur often."""
+    
+    def __init__(self, lang=DE_LANG):
+        self.lang = lang
+        self.stopwords = frozenset(STOPWORDS[lang])
+        self.pos_filter = frozenset(POS_FILTER[lang])
+        self.surface_triggers = tuple(SURFACE_TRIGGERS)
+        self.cache = {}
+    
+    def normalize(self, lemma, surface, pos):
+        """Return word to use for LDA, or None (memoized)."""
+        key = (lemma, surface, pos)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        
+        word = self._normalize(lemma, surface, pos)
+        if len(self.cache) >= NORMALIZE_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = word
+        return word
+    
+    def _normalize(self, lemma, surface, pos):
+        """Return word to use for LDA, or None."""
+        if WITH_POS_FILTER and pos not in self.pos_filter:
+            return None
+        
+        word = None
+        try:
+            if WITH_LEMMATA:
+                word = lemma.lower()
+                if self._is_lemma_bogus(word):
+                    word = surface.lower()
+            else:
+                word = surface.lower()
+        except AttributeError:
+            # Lemma or surface form missing. With PoS filter, such words
+            # are dropped, otherwise the lemma (if any) is kept.
+            if WITH_POS_FILTER:
+                return None
+        
+        # Don't add stop words, in any case
+        if word is None or word in self.stopwords \
+        or len(word) < MIN_WORDLEN:
+            return None
+        
+        # Transform umlauts to ASCII friendly form, because of encoding
+        # issues of some LDA tools (pure ASCII str has none in Python 2)
+        if not isinstance(word, bytes):
+            word = word.translate(UMLAUT_TABLE)
+        return word.encode(ENCODING)
+    
+    def _is_lemma_bogus(self, lemma):
+        """ Return true if the lemma is not useful for LDA, otherwise
+            false.
+        """
+        for bogus_symbol in self.surface_triggers:
+            if bogus_symbol in lemma:
+                return True
+        
+        # That's the last resort
+        return False
+
+class ArticlesCorpus:
+    """Disk-backed list of articles in a compact form: words are interned
+       in a vocabulary, and articles are stored as word ids (uint32) in 
+       a single flat file, with offsets marking where articles end. It 
+       can be iterated over several times (as gensim expects from a 
+       corpus) without holding the articles in memory."""
+    
+    def __init__(self, filepath, mode='w'):
+        self.filepath = filepath
+        self.vocabulary = {} # Word -> word id
+        self.words = [] # Word id -> word
+        self.offsets = array('L', [0]) # Article i: offsets[i:i+2]
+        self.vocabulary_sizes = array('L') # Vocabulary size per article
+        self._filehdl = None
+        
+        # Corpus written before is only read
+        if mode == 'r':
+            self._load_index()
+        else:
+            self._filehdl = open(filepath, 'wb')
+    
+    def append(self, article):
+        """Write out a single article (list of encoded words)."""
+        word_ids = array('I')
+        for word in article:
+            word_id = self.vocabulary.get(word)
+            if word_id is None:
+                word_id = self.vocabulary[word] = len(self.words)
+                self.words.append(word)
+            word_ids.append(word_id)
+            
+        word_ids.tofile(self._filehdl)
+        self.offsets.append(self.offsets[-1] + len(word_ids))
+        self.vocabulary_sizes.append(len(self.words))
+    
+    def extend(self, articles):
+        """Write out several articles."""
+        for article in articles:
+            self.append(article)
+    
+    def close(self):
+        """Finish writing; the corpus can only be read from now on."""
+        self._filehdl.close()
+        self._save_index()
+    
+    def _save_index(self):
+        """Save vocabulary and offsets along with the word ids."""
+        with open(self.filepath + '.words', 'wb') as filehdl:
+            filehdl.write(b''.join(word + b'\n' for word in self.words))
+        np.array(self.offsets, dtype=np.uint64).tofile(self.filepath +
+                                                       '.offsets')
+        np.array(self.vocabulary_sizes, dtype=np.uint64).tofile(
+            self.filepath + '.sizes')
+    
+    def _load_index(self):
+        """Load vocabulary and offsets saved along with the word ids."""
+        with open(self.filepath + '.words', 'rb') as filehdl:
+            self.words = filehdl.read().split(b'\n')[:-1]
+        self.vocabulary = dict((word, word_id) for word_id, word
+                               in enumerate(self.words))
+        self.offsets = array('L', np.fromfile(self.filepath + '.offsets',
+                                              dtype=np.uint64).tolist())
+        self.vocabulary_sizes = array('L', np.fromfile(self.filepath + 
+                                                       '.sizes', 
+                                                       dtype=np.uint64).\
+                                                       tolist())
+    
+    def word_ids(self):
+        """Return word ids of all articles (in a single array)."""
+        if self._filehdl is not None and not self._filehdl.closed:
+            self._filehdl.flush()
+        if self.number_of_tokens() == 0:
+            return np.zeros(0, dtype=np.uint32)
+        return np.memmap(self.filepath, dtype=np.uint32, mode='r')
+    
+    def number_of_tokens(self):
+        """Return number of words over all articles."""
+        return self.offsets[-1]
+    
+    def number_of_types(self):
+        """Return number of distinct words over all articles."""
+        return len(self.words)
+    
+    def dictionary(self):
+        """Return gensim dictionary of the articles, equal to the one 
+           gensim builds from the articles as lists of words."""
+        dictionary = Dictionary()
+        word_ids = self.word_ids()
+        
+        # gensim assigns ids to the words new to an article in their
+        # sorted order; these are the article's newly interned words.
+        tokens = [word.decode(ENCODING) for word in self.words]
+        token_ids = np.zeros(len(tokens), dtype=np.int64)
+        vocabulary_size = 0
+        for article_vocabulary_size in self.vocabulary_sizes:
+            new_word_ids = sorted(range(vocabulary_size, 
+                                        article_vocabulary_size),
+                                  key=tokens.__getitem__)
+            for word_id in new_word_ids:
+                token_ids[word_id] = len(dictionary.token2id)
+                dictionary.token2id[tokens[word_id]] = \
+                    len(dictionary.token2id)
+            vocabulary_size = article_vocabulary_size
+        
+        # Document and collection frequencies
+        dfs = np.zeros(len(tokens), dtype=np.int64)
+        for article_start, article_end in self._article_bounds():
+            article_word_ids = np.unique(word_ids[article_start:
+                                                  article_end])
+            dfs[article_word_ids] += 1
+            dictionary.num_nnz += len(article_word_ids)
+        cfs = np.bincount(word_ids, minlength=len(tokens))
+        
+        dictionary.dfs = dict(zip(token_ids.tolist(), dfs.tolist()))
+        dictionary.cfs = dict(zip(token_ids.tolist(), cfs.tolist()))
+        dictionary.num_docs = len(self)
+        dictionary.num_pos = self.number_of_tokens()
+        
+        return dictionary
+    
+    def bow_corpus(self, dictionary):
+        """Yield bag-of-words of the articles based on the dictionary
+           given, like gensim's doc2bow() does."""
+        word_ids = self.word_ids()
+        
+        # Word id -> dictionary id (-1 if not in dictionary)
+        token_ids = np.array([dictionary.token2id.get(word.decode(ENCODING),
+                                                      -1)
+                              for word in self.words], dtype=np.int64)
+        
+        for article_start, article_end in self._article_bounds():
+            article_token_ids = token_ids[word_ids[article_start:
+                                                   article_end]]
+            article_token_ids = article_token_ids[article_token_ids >= 0]
+            bow_ids, bow_counts = np.unique(article_token_ids,
+                                            return_counts=True)
+            yield list(zip(bow_ids.tolist(), bow_counts.tolist()))
+    
+    def _article_bounds(self):
+        """Yield start and end offset of each article."""
+        for article_no in range(len(self)):
+            yield (self.offsets[article_no], self.offsets[article_no + 1])
+    
+    def __iter__(self):
+        """Yield articles one by one as list of encoded words."""
+        word_ids = self.word_ids()
+        for article_start, article_end in self._article_bounds():
+            yield [self.words[word_id] for word_id 
+                   in word_ids[article_start:article_end].tolist()]
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+
+class LdaCluster:
+    """Local cluster for distributed LDA: a Pyro4 name server, the gensim
+       LDA dispatcher and a number of LDA workers, all run as
+       subprocesses (instead of starting them by distrib_lda.sh)."""
+    
+    def __init__(self, number_of_workers, host=DISTRIBUTED_NS_HOST,
+                 port=DISTRIBUTED_NS_PORT):
+        self.number_of_workers = number_of_workers
+        self.host = host
+        self.port = port
+        self.ns_conf = {'host': host, 'port': port, 'broadcast': False}
+        self.processes = []
+        self.dispatcher_log_filepath = DISTRIBUTED_DIR + \
+                                       'lda_dispatcher.log'
+    
+    def start(self):
+        """Start all processes and wait until the workers are known to
+           the name server."""
+        
+        # Models are passed between the processes as pickles only
+        environ['PYRO_SERIALIZERS_ACCEPTED'] = 'pickle'
+        environ['PYRO_SERIALIZER'] = 'pickle'
+        import Pyro4
+        Pyro4.config.SERIALIZERS_ACCEPTED.add('pickle')
+        Pyro4.config.SERIALIZER = 'pickle'
+        
+        ns_arguments = ['--host', self.host, '--port', str(self.port),
+                        '--no-broadcast']
+        print('Start Pyro4 name server at ' + self.host + ':' + 
+              str(self.port) + '.')
+        self._spawn('name_server', ['-m', 'Pyro4.naming', '-x',
+                                    '-n', self.host, '-p', str(self.port)])
+        self._wait_until_registered(0)
+        
+        print('Start LDA dispatcher and ' + str(self.number_of_workers) +
+              ' LDA workers.')
+        self._spawn('lda_dispatcher', ['-m', 'gensim.models.lda_dispatcher',
+                                       '-v'] + ns_arguments)
+        for worker_no in range(self.number_of_workers):
+            self._spawn('lda_worker_' + str(worker_no), 
+                        ['-m', 'gensim.models.lda_worker'] + ns_arguments)
+        self._wait_until_registered(self.number_of_workers)
+    
+    def stop(self):
+        """Terminate all processes (those started last first)."""
+        for name, process, log_file in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+        
+        deadline = time() + DISTRIBUTED_SHUTDOWN_TIMEOUT
+        for name, process, log_file in reversed(self.processes):
+            while process.poll() is None and time() < deadline:
+                sleep(0.1)
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            log_file.close()
+        self.processes = []
+    
+    def print_throughput(self, seconds, number_of_docs):
+        """Print jobs done and (approximate) docs/sec of each worker,
+           as logged by the dispatcher."""
+        
+        jobs_done = [0] * self.number_of_workers
+        with open(self.dispatcher_log_filepath) as log_file:
+            for line in log_file:
+                job_match = match(r'.* worker #(\d+) finished job #', line)
+                if job_match and int(job_match.group(1)) < \
+                                 self.number_of_workers:
+                    jobs_done[int(job_match.group(1))] += 1
+        
+        # All jobs are chunks of (about) the same number of documents
+        total_jobs_done = max(sum(jobs_done), 1)
+        for worker_no, worker_jobs_done in enumerate(jobs_done):
+            print('Worker #' + str(worker_no) + ': ' +
+                  str(worker_jobs_done) + ' jobs, ' + '%.1f' %
+                  (number_of_docs * worker_jobs_done / 
+                   float(total_jobs_done) / max(seconds, 1e-9)) + 
+                  ' docs/sec')
+    
+    def _spawn(self, name, arguments):
+        """Start a Python subprocess logging into a file of its own."""
+        log_file = open(DISTRIBUTED_DIR + name + '.log', 'w')
+        process = Popen([sys.executable] + arguments, stdout=log_file,
+                        stderr=STDOUT, env=environ.copy())
+        self.processes.append((name, process, log_file))
+    
+    def _wait_until_registered(self, number_of_workers):
+        """Wait until the name server is up and knows the dispatcher
+           (if number_of_workers > 0) and number_of_workers workers."""
+        import Pyro4
+        from gensim.models.lda_dispatcher import LDA_DISPATCHER_PREFIX
+        from gensim.models.lda_worker import LDA_WORKER_PREFIX
+        
+        deadline = time() + DISTRIBUTED_STARTUP_TIMEOUT
+        while True:
+            for name, process, log_file in self.processes:
+                if process.poll() is not None:
+                    raise RuntimeError(name + ' exited (see ' + 
+                                       DISTRIBUTED_DIR + name + '.log)')
+            try:
+                name_server = Pyro4.locateNS(self.host, self.port)
+                if number_of_workers == 0 or \
+                   (name_server.list(prefix=LDA_DISPATCHER_PREFIX) and 
+                    len(name_server.list(prefix=LDA_WORKER_PREFIX)) >= 
+                    number_of_workers):
+                    return
+            except Pyro4.errors.PyroError:
+                pass
+            if time() > deadline:
+                raise RuntimeError('local cluster not ready after ' + 
+                                   str(DISTRIBUTED_STARTUP_TIMEOUT) + 
+                                   ' seconds')
+            sleep(0.5)
+
+class CsrCorpus:
+    """Bag-of-words corpus in compressed sparse row form, as three flat
+       binary files memory-mapped when read: the offsets of the 
+       documents (.indptr), their word ids (.indices) and counts or
+       weights (.data). It streams documents as lists of (word id, 
+       weight), like gensim's corpora do, but reads them by blocks 
+       instead of parsing text."""
+    
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.indptr = np.fromfile(filepath + '.indptr', dtype=np.uint64)
+        self.indices = self._memmap('.indices', np.uint32)
+        self.data = self._memmap('.data', np.float32)
+    
+    @staticmethod
+    def serialize(filepath, corpus):
+        """Write a corpus (documents as lists of (word id, weight))."""
+        indptr = array('L', [0])
+        with open(filepath + '.indices', 'wb') as indices_filehdl, \
+             open(filepath + '.data', 'wb') as data_filehdl:
+            for doc in corpus:
+                np.array([word_id for word_id, weight in doc],
+                         dtype=np.uint32).tofile(indices_filehdl)
+                np.array([weight for word_id, weight in doc],
+                         dtype=np.float32).tofile(data_filehdl)
+                indptr.append(indptr[-1] + len(doc))
+        
+        # Written last: it tells whether the corpus is complete
+        np.array(indptr, dtype=np.uint64).tofile(filepath + '.indptr')
+    
+    @staticmethod
+    def from_mm(mm_filepath, filepath):
+        """Convert a Matrix Market file (as written by gensim's
+           MmCorpus) without going through documents one by one."""
+        with open(mm_filepath, 'rb') as filehdl:
+            line = filehdl.readline()
+            while line.startswith(b'%'):
+                line = filehdl.readline()
+            number_of_docs = int(line.split()[0])
+            entries = np.fromfile(filehdl, dtype=np.float64, sep=' ')
+        
+        # Entries are (doc, word id, weight), counted from 1
+        entries = entries.reshape(-1, 3)
+        docs = entries[:, 0].astype(np.int64) - 1
+        order = np.argsort(docs, kind='mergesort')
+        indptr = np.zeros(number_of_docs + 1, dtype=np.uint64)
+        np.cumsum(np.bincount(docs, minlength=number_of_docs),
+                  out=indptr[1:])
+        
+        (entries[order, 1] - 1).astype(np.uint32).tofile(filepath + 
+                                                         '.indices')
+        entries[order, 2].astype(np.float32).tofile(filepath + '.data')
+        indptr.tofile(filepath + '.indptr')
+    
+    def _memmap(self, suffix, dtype):
+        """Return memory-mapped column (empty ones can't be mapped)."""
+        if self.indptr[-1] == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.filepath + suffix, dtype=dtype, mode='r')
+    
+    def __iter__(self):
+        """Yield documents one by one as lists of (word id, weight)."""
+        for block_start in range(0, len(self), CSR_BLOCK_SIZE):
+            block_end = min(block_start + CSR_BLOCK_SIZE, len(self))
+            block_indptr = (self.indptr[block_start:block_end + 1] - 
+                            self.indptr[block_start]).tolist()
+            start, end = self.indptr[block_start], self.indptr[block_end]
+            block_pairs = list(zip(self.indices[start:end].tolist(),
+                                   self.data[start:end].tolist()))
+            for doc_no in range(block_end - block_start):
+                yield block_pairs[block_indptr[doc_no]:
+                                  block_indptr[doc_no + 1]]
+    
+    def __getitem__(self, doc_no):
+        """Return a single document."""
+        start, end = self.indptr[doc_no], self.indptr[doc_no + 1]
+        return list(zip(self.indices[start:end].tolist(),
+                        self.data[start:end].tolist()))
+    
+    def __len__(self):
+        return len(self.indptr) - 1
+
+class PipelineStage:
+    """Stage of the pipeline building a collection. Its fingerprint 
+       covers its settings and the fingerprints of its input stages; it
+       is only run where its artifacts are missing or were made with 
+       another fingerprint, otherwise its results are loaded from the 
+       artifacts. Stages without artifacts are always run. Its outputs
+       are the attributes of the collection it sets."""
+    
+    def __init__(self, name, run, load, artifacts, settings, inputs=[],
+                 outputs=[]):
+        self.name = name
+        self.run = run
+        self.load = load
+        self.artifacts = artifacts
+        self.settings = settings
+        self.inputs = inputs
+        self.outputs = outputs
+        self.executed = False
+    
+    def fingerprint(self):
+        """Return fingerprint of settings and inputs."""
+        return md5(repr([self.name, self.settings] + 
+                        [stage.fingerprint() for stage 
+                         in self.inputs]).encode(ENCODING)).hexdigest()
+    
+    def stamp_filepath(self):
+        """Return filepath the fingerprint of the artifacts is kept in."""
+        return self.artifacts[0] + '.stage'
+    
+    def is_fresh(self):
+        """Tell whether the artifacts are there and up to date."""
+        if not self.artifacts or not exists(self.stamp_filepath()):
+            return False
+        for artifact in self.artifacts:
+            if not exists(artifact):
+                return False
+        with open(self.stamp_filepath(), 'r') as filehdl:
+            return filehdl.read().strip() == self.fingerprint()
+    
+    def execute(self):
+        """Run the stage, or load its results if it is up to date."""
+        if self.is_fresh():
+            print('Stage ' + self.name + ' is up to date.')
+            if self.load is not None:
+                self.load()
+            self.executed = True
+            return
+        
+        self.run()
+        
+        # Written last: it marks the artifacts as complete
+        if self.artifacts:
+            with open(self.stamp_filepath(), 'w') as filehdl:
+                filehdl.write(self.fingerprint() + '\n')
+        self.executed = True
+
 class ArticlesCollection:
     """Class which holds all articles (perhaps over several years)
-       -- with ability to perform LDA on it."""
+       -- with ability to perform LDA on it. Articles, dictionary and
+       bag-of-words are set by the stages of its pipeline, each stage 
+       being executed when its outputs are first needed."""
     
-    def __init__(self, year_range, text_output_dirpath, lang=DE_LANG):
+    def __init__(self, year_range, text_output_dirpath, lang=DE_LANG,
+                 jobs=1, incremental=False, text_format=TEXT_OUTPUT_FORMAT,
+                 use_store=USE_STORE, profiler=None):
         self.year_range = year_range
         self.text_output_dirpath = text_output_dirpath
         self.lang = lang
-        self.articles = []
-        self.bow_corpus = None
+        self.jobs = jobs
+        self.incremental = incremental
+        self.text_format = text_format
+        self.use_store = use_store
         self.identifier = ''
+        self.articles_filepath = ''
         self.wordsids_filepath = ''
         self.bowmm_filepath = ''
         self.tfidf_filepath = ''
-        self.number_of_docs = 0
-        self.number_of_tokens = 0
-        self.number_of_types = 0
+        self.stages = []
+        self.profiler = profiler
+        if self.profiler is None:
+            self.profiler = tbprofile.Profiler()
         
-        # gensim data structures
-        self.dictionary = None
+        # Articles are only kept in the segments
+        if self.incremental:
+            self.articles = None
         
-        # Read in collection & clean it & start LDA process
-        self._read_collection()
+        # Stages are only executed where needed (see __getattr__()), 
+        # those up to date are skipped
         self._collection_identifier()
         self._set_filepaths()
-        self._create_dictionary()
-        self._create_bow_representation()
-        self._set_number_of_docs()
-        self._set_number_of_tokens()
-        self._set_number_of_types()
-        
-        # Create tf*idf matrix if requested.
-        if USE_TFIDF:
-            self._create_tfidf_matrix()
+        self._set_stages()
+    
+    def __getattr__(self, name):
+        """Return output of a stage (see _set_stages()), executing the 
+           stage where it was not yet."""
+        for stage in self.__dict__.get('stages', []):
+            if name in stage.outputs:
+                self._execute_stage(stage)
+                return self.__dict__[name]
+        raise AttributeError(name)
+    
+    def execute_stages(self):
+        """Execute all stages, e. g. to only preprocess the collection."""
+        for stage in self.stages:
+            self._execute_stage(stage)
+    
+    def show_stages(self, outputs=None):
+        """Print which stages would be executed to get the outputs given
+           (those of all stages if none are given), and how."""
+        needed = set()
+        for stage in self.stages:
+            if outputs is None or set(stage.outputs) & set(outputs):
+                self._add_needed_stage(stage, needed)
+        for stage in self.stages:
+            if stage.name not in needed:
+                print('Stage ' + stage.name + ': not needed, skipped')
+            elif stage.is_fresh():
+                print('Stage ' + stage.name + ': up to date, skipped')
+            else:
+                print('Stage ' + stage.name + ': to be run')
+    
+    def write_profile(self, filepath):
+        """Write profile of the stages executed (see tbprofile)."""
+        self._count_profiled_stages()
+        self.profiler.write(filepath)
     
-    def show_lda(self):
-        """Show latent topics found."""
+    def show_lda(self, cluster=None, retrain=False):
+        """Show latent topics found (training distributed if a started
+           LdaCluster is given). A model saved before with the same
+           settings is loaded instead of being trained (unless retrain
+           is requested); the collection is only read where the model
+           is trained."""
         
         model = None
+        model_cache = ModelCache()
+        
+        print('Number of topics to show: ' + str(TOPICS_DISPLAY))
+        
+        if USE_MODEL_CACHE and not retrain:
+            model = model_cache.load(self.identifier, self.lang)
+        
+        if model is None:
+            # k = number of documents = number of topics (for now)
+            num_topics = self.number_of_docs
+            if NUM_TOPICS != -1:
+                num_topics = NUM_TOPICS
+            
+            print('Number of docs presented: ' + str(self.number_of_docs))
+            print('Number of origin. tokens: ' + 
+                  str(self.number_of_tokens))
+            print('Number of original types: ' + 
+                  str(self.number_of_types))
+            print('Number of types at usage: ' + 
+                  str(len(self.dictionary.keys())))
+            print('Number of topics to find: ' + str(num_topics))
+            
+            # Only use tf*idf input if requested.
+            if USE_TFIDF:
+                corpus = self.tfidf_corpus
+            else:
+                corpus = self.bow_corpus
+            
+            start_time = time()
+            with self.profiler.stage('lda_fit') as profiled_stage:
+                model = train_model(corpus, self.dictionary, num_topics,
+                                    cluster)
+                profiled_stage.count(articles=self.number_of_docs)
+            seconds = time() - start_time
+            print('Training time (seconds):  ' + '%.1f' % seconds)
+            print('Training throughput:      ' + '%.1f' % 
+                  (self.number_of_docs / max(seconds, 1e-9)) + 
+                  ' docs/sec')
+            if cluster is not None:
+                cluster.print_throughput(seconds, self.number_of_docs)
+            if USE_MODEL_CACHE:
+                model_cache.save(model, self.identifier, self.lang)
+        
+        show_topics(model)
+
+    def train_online(self, period=ONLINE_PERIODS[0], retrain=False,
+                     perplexity=False):
+        """Train the model online, period (year or decade) by period,
+           and save a checkpoint of it after each period; return the 
+           model of the last one. Checkpoints saved before are loaded 
+           instead of training again (unless retrain is requested). The
+           perplexity of each period is only logged if requested."""
         
         # Only use tf*idf input if requested.
-        corpus = self.bow_corpus
         if USE_TFIDF:
-            corpus = MmCorpus(self.tfidf_filepath)
+            corpus = self.tfidf_corpus
+        else:
+            corpus = self.bow_corpus
         
-        # k = number of documents = number of topics (for now)
         num_topics = self.number_of_docs
         if NUM_TOPICS != -1:
             num_topics = NUM_TOPICS
         
         print('Number of docs presented: ' + str(self.number_of_docs))
-        print('Number of origin. tokens: ' + str(self.number_of_tokens))
-        print('Number of original types: ' + str(self.number_of_types))
-        print('Number of types at usage: ' + str(len(self.dictionary.\
-                                                     keys())))
         print('Number of topics to find: ' + str(num_topics))
-        print('Number of topics to show: ' + str(TOPICS_DISPLAY))
+        print('Train online by:          ' + period)
         
-        if MODEL == 'LdaMallet':
-            model = LdaMallet(PATH_TO_MALLET_BIN,
-                            corpus=corpus,
-                            num_topics=num_topics,
-                            id2word=self.dictionary,
-                            iterations=ITERATIONS)
-                            
-        elif MODEL == 'HdpModel':
-            model = HdpModel(corpus, self.dictionary)
-        else:
-            model = LdaModel(corpus=corpus,
-                           id2word=self.dictionary,
-                           num_topics=num_topics,
-                           iterations=ITERATIONS,
-                           update_every=1,
-                           chunksize=10,
-                           passes=1,
-                           distributed=False)
-                           
-            '''
-            More possible options above:
-                           chunksize=1,
-                           update_every=1,
-                           decay=0.5,
-            '''
-        
-        if MODEL == 'LdaModel' or MODEL == 'LdaMallet':               
-            topic_number = 0
-            for topic in model.show_topics(topics=TOPICS_DISPLAY, 
-                                         topn=WORDS_DISPLAY,
-                                         formatted=True):
-                topic_number += 1
-                print('Topic#' + str(topic_number) + ': ', topic)
-        else: # For MODEL 'HdpModel'
-            for topic in model.print_topics(topics=TOPICS_DISPLAY, \
-                               topn=WORDS_DISPLAY):
-                print topic
-
+        # Untrained model, updated with the documents of each period
+        checkpoints = ModelCache(CHECKPOINT_DIR)
+        model = train_model(None, self.dictionary, num_topics)
+        docs = iter(corpus)
+        
+        # Training continues from the last checkpoint saved before
+        checkpoint_label = None
+        for label, number_of_period_docs in self._periods(period):
+            if not retrain and checkpoints.exists(self.identifier, 
+                                                  self.lang, label):
+                checkpoint_label = label
+                for doc in islice(docs, number_of_period_docs):
+                    pass
+                continue
+            if checkpoint_label is not None:
+                model = checkpoints.load(self.identifier, self.lang,
+                                         checkpoint_label)
+                checkpoint_label = None
+            
+            period_docs = list(islice(docs, number_of_period_docs))
+            start_time = time()
+            with self.profiler.stage('lda_fit') as profiled_stage:
+                model.update(period_docs)
+                profiled_stage.count(articles=len(period_docs))
+            seconds = time() - start_time
+            message = 'Period ' + label + ': ' + \
+                      str(len(period_docs)) + ' docs, ' + \
+                      '%.1f' % seconds + ' seconds'
+            if perplexity:
+                message += ', perplexity ' + \
+                           '%.1f' % 2 ** -model.log_perplexity(period_docs)
+            print(message)
+            checkpoints.save(model, self.identifier, self.lang, label)
+        
+        if checkpoint_label is not None:
+            model = checkpoints.load(self.identifier, self.lang,
+                                     checkpoint_label)
+        
+        return model
+    
+    def _periods(self, period):
+        """Return label (like 1957 or 1950s) and number of documents of 
+           each period with documents, in order."""
+        periods = []
+        year_ends = [first_doc for year, first_doc in self.years[1:]] + \
+                    [self.number_of_docs]
+        for (year, first_doc), end_doc in zip(self.years, year_ends):
+            label = str(year)
+            if period == 'decade':
+                label = str(year // 10 * 10) + 's'
+            if end_doc == first_doc:
+                continue
+            if periods and periods[-1][0] == label:
+                periods[-1][1] += end_doc - first_doc
+            else:
+                periods.append([label, end_doc - first_doc])
+        
+        return periods
+    
     def _set_number_of_types(self):
         """Set number of types (from tokens)."""
-        self.number_of_types = len(set(list(itertools.\
-                                    chain(*self.articles))))
+        self.number_of_types = self.articles.number_of_types()
         
     def _set_number_of_tokens(self):
         """Set number of tokens gotten in all documents."""
-        self.number_of_tokens = sum(len(article) \
-                                    for article in self.articles)
+        self.number_of_tokens = self.articles.number_of_tokens()
         
     def _set_number_of_docs(self):
         """Set number of docs found in collection read in."""
         self.number_of_docs = len(self.articles)
+    
+    def _set_numbers(self):
+        """Set numbers of docs, tokens and types."""
+        self._set_number_of_docs()
+        self._set_number_of_tokens()
+        self._set_number_of_types()
         
     def _set_filepaths(self):
         """Sets filepaths for intermediate data."""
 
         # Filepaths necessary for topic modeling
+        self.articles_filepath = ARTICLES_DIR + self.identifier + \
+                                 '_' + 'articles.ids'
         self.wordsids_filepath = WORDSIDS_DIR + self.identifier + \
                                  '_' + 'wordsids.txt'
         self.bowmm_filepath = BOWMM_DIR + self.identifier + '_' + \
@@ -243,11 +1676,126 @@ class ArticlesCollection:
         self.tfidf_filepath = TFIDF_DIR + self.identifier + '_' + \
                               'tfidf.mm'
 
+    def _set_stages(self):
+        """Set the stages of the pipeline (see PipelineStage); the inputs
+           of a stage are the ones whose outputs it is run on."""
+        
+        # Counts are set by reading in (or loading) the articles
+        numbers = ['number_of_docs', 'number_of_tokens', 'number_of_types']
+        if self.incremental:
+            read_stage = PipelineStage('segments', self._read_segments, 
+                                       None, [], self._books_settings(),
+                                       outputs=['segments', 
+                                                'segments_dictionary',
+                                                'years'] + numbers)
+        else:
+            read_stage = PipelineStage('articles', self._read_collection,
+                                       self._load_collection,
+                                       [self.articles_filepath + suffix
+                                        for suffix in ['', '.words', 
+                                                       '.offsets', 
+                                                       '.sizes', 
+                                                       '.years']],
+                                       self._books_settings(),
+                                       outputs=['articles', 'years'] + 
+                                               numbers)
+        dictionary_stage = PipelineStage('dictionary',
+                                         self._create_dictionary,
+                                         self._load_dictionary,
+                                         [self.wordsids_filepath],
+                                         [NO_BELOW, NO_ABOVE], 
+                                         [read_stage], ['dictionary'])
+        bow_stage = PipelineStage('bow', self._create_bow_representation,
+                                  self._load_bow_representation,
+                                  [self.bowmm_filepath], [], 
+                                  [read_stage, dictionary_stage],
+                                  ['bow_corpus'])
+        self.stages = [read_stage, dictionary_stage, bow_stage]
+        
+        # Create tf*idf matrix if requested.
+        if USE_TFIDF:
+            self.stages.append(PipelineStage('tfidf', 
+                                             self._create_tfidf_matrix,
+                                             self._load_tfidf_matrix,
+                                             [self.tfidf_filepath], [], 
+                                             [dictionary_stage, bow_stage],
+                                             ['tfidf_corpus']))
+    
+    def _execute_stage(self, stage):
+        """Execute stage where it was not yet; a stage to be run gets 
+           its inputs executed first."""
+        if stage.executed:
+            return
+        if not stage.is_fresh():
+            for input_stage in stage.inputs:
+                self._execute_stage(input_stage)
+        with self.profiler.stage(PROFILED_STAGES[stage.name]):
+            stage.execute()
+    
+    def _count_profiled_stages(self):
+        """Set counters of the stages executed (see PROFILED_STAGES); 
+           they are only known once the articles were read in."""
+        if not self.stages[0].executed:
+            return
+        for stage in self.stages:
+            if not stage.executed:
+                continue
+            profiled_stage = self.profiler.stage(PROFILED_STAGES[stage.name])
+            profiled_stage.count(articles=self.number_of_docs)
+            if stage.name != 'bow' and stage.name != 'tfidf':
+                profiled_stage.count(tokens=self.number_of_tokens)
+    
+    def _books_settings(self):
+        """Return settings the articles read in depend on: the key of
+           each book (see TokenCache) and how text is written out."""
+        books_keys = []
+        for year in self.year_range:
+            try:
+                books_keys.append(TokenCache().key(year, self.lang))
+            except OSError:
+                books_keys.append(None) # Book missing
+        
+        return [self.identifier, self.incremental, self.text_format,
+                self.text_output_dirpath, books_keys]
+    
+    def _add_needed_stage(self, stage, needed):
+        """Add name of the stage to the ones needed, along with its 
+           inputs where it is to be run (see _execute_stage())."""
+        needed.add(stage.name)
+        if not stage.is_fresh():
+            for input_stage in stage.inputs:
+                self._add_needed_stage(input_stage, needed)
+    
+    def _load_collection(self):
+        """Load articles read in before."""
+        self.articles = ArticlesCorpus(self.articles_filepath, mode='r')
+        with open(self.articles_filepath + '.years', 'r') as filehdl:
+            self.years = [tuple(int(field) for field in line.split('\t'))
+                          for line in filehdl]
+        self._set_numbers()
+    
+    def _load_dictionary(self):
+        """Load dictionary created before."""
+        self.dictionary = Dictionary.load_from_text(self.wordsids_filepath)
+    
+    def _load_bow_representation(self):
+        """Load bag-of-words representation created before."""
+        self.bow_corpus = open_corpus(self.bowmm_filepath)
+    
+    def _load_tfidf_matrix(self):
+        """Load TF-IDF matrix created before."""
+        self.tfidf_corpus = open_corpus(self.tfidf_filepath)
+    
     def _create_dictionary(self):
         """Create a mapping of ids and surface froms (=words)."""
         
         print('Create dictionary of collection.')
-        self.dictionary = Dictionary(self.articles)
+        
+        # The dictionary merged from the segments just needs filtering
+        if self.incremental:
+            self.dictionary = self.segments_dictionary
+        else:
+            self.dictionary = self.articles.dictionary()
         self.dictionary.filter_extremes(no_below=NO_BELOW,
                                         no_above=NO_ABOVE)
         self.dictionary.save_as_text(self.wordsids_filepath)
@@ -259,10 +1807,31 @@ class ArticlesCollection:
            in Matrix Matrix format to disk."""
         
         print('Create bag-of-words matrix representation.')
-        self.bow_corpus = [self.dictionary.doc2bow(article) 
-                           for article in self.articles]
-        MmCorpus.serialize(self.bowmm_filepath, self.bow_corpus)
+        if self.incremental:
+            bow_corpus = self._segments_bow_corpus()
+        else:
+            bow_corpus = self.articles.bow_corpus(self.dictionary)
+        MmCorpus.serialize(self.bowmm_filepath, bow_corpus)
+        
+        # Bag-of-words are streamed from disk from now on
+        self.bow_corpus = open_corpus(self.bowmm_filepath)
 
+    def _segments_bow_corpus(self):
+        """Yield bag-of-words of all segments' documents, with the ids
+           of the segments mapped to the ones of the collection's 
+           (filtered) dictionary."""
+        for segment_filepath in self.segments:
+            segment_dictionary = Dictionary.load(segment_filepath + '.dict')
+            segment_ids = {}
+            for token, segment_id in segment_dictionary.token2id.items():
+                if token in self.dictionary.token2id:
+                    segment_ids[segment_id] = self.dictionary.token2id[token]
+            
+            for bow in MmCorpus(segment_filepath + '.mm'):
+                yield sorted((segment_ids[segment_id], int(count))
+                             for segment_id, count in bow
+                             if segment_id in segment_ids)
+    
     def _create_tfidf_matrix(self):
         """Create TF-IDF matrix and save it in Matrix Matrix format to 
            disk"""
@@ -274,140 +1843,93 @@ class ArticlesCollection:
         MmCorpus.serialize(self.tfidf_filepath, 
                            tfidf[self.bow_corpus])
         print('Number of documents:', tfidf.num_docs)
+        self.tfidf_corpus = open_corpus(self.tfidf_filepath)
 
     def _collection_identifier(self):
-        """Collection id is important for the caching files and the
-           file naming of the corresponding files."""
-           
-        start_year = self.year_range[0]
-        end_year = self.year_range[-1]
-        
-        if start_year == end_year:
-            self.identifier = str(start_year) + '_' + self.lang
-        else:
-            self.identifier = str(start_year) + '-' + str(end_year) + \
-                              '_' + self.lang 
+        """Set collection id (see collection_identifier())."""
+        self.identifier = collection_identifier(self.year_range, self.lang)
         
     def _read_collection(self):
         """Iterate through all years in order to get all articles read
            in."""
-        for year in self.year_range:
-            # Not every single yearbook is available.
-            try:
-                self._read_book(year)
-            except:
-                print('Skip (inexistent) yearbook ' + str(year) + '.')
+        self.articles = ArticlesCorpus(self.articles_filepath)
+        self.years = [] # Year and number of its first document
+        text_output = TextOutput(self.text_output_dirpath, self.lang,
+                                 self.text_format)
         
-    def _read_book(self, year):
-        """Read in a a single book and save its articles."""
-        filepath = sac_filepath(year, lang=self.lang)
-        
-        print('Read in yearbook ' + str(year) + '.')
-        sac_xml = etree.parse(SAC_XML_DIR + filepath)
-        sac_xml_articles_list = sac_xml.xpath('.//article')
-        
-        # For each article
-        for sac_xml_article in sac_xml_articles_list:
-            
-            # Prepare file to write out words
-            sac_xml_article_no = sac_xml_article.attrib['n']
-            out_filename = str(year) + '-' + str(self.lang) + '-' \
-                           + sac_xml_article_no + '.txt'
-            out_filepath = self.text_output_dirpath + sep + out_filename
-            print(out_filepath)
-            out_filehdl = open(out_filepath, 'w')
-                               
-            article_word_list = []
-            sac_xml_sentences_list = \
-                sac_xml_article.xpath('.//s[@lang=\'' + \
-                                      self.lang + '\']')
-            # For each sentence (in the article)
-            for sac_xml_sentence in sac_xml_sentences_list:
-                sac_xml_words_list = \
-                    sac_xml_words_list = sac_xml_sentence.xpath('.//w')
-                # For each word (in the sentence of the article)
-                for sac_xml_word in sac_xml_words_list:
-                    word = None
-                    try:
-                        if WITH_POS_FILTER is False:
-                            if WITH_LEMMATA:
-                                word = sac_xml_word.attrib['lemma'].lower()
-                                if self._is_lemma_bogus(word):
-                                    word = sac_xml_word.text.lower()
-                            if WITH_LEMMATA is False:
-                                word = sac_xml_word.text.lower()
-                        elif WITH_POS_FILTER:
-                            word = self._get_pos_filtered_word(sac_xml_word)
-                    except:
-                        pass
-                        
-                    # Don't add stop words, in any case
-                    if not word in STOPWORDS[self.lang] \
-                    and word is not None and len(word) >= MIN_WORDLEN:
-                        article_word_list.append(self.\
-                                                 _normalize_word(word).\
-                                                 encode(ENCODING))
-            # Save article as bag-of-words (of the sentences)
-            self.articles.append(article_word_list)
-            out_filehdl.write(' '.join(article_word_list))
-            out_filehdl.close()
-    
-    def _get_pos_filtered_word(self, sac_xml_word):
-        """ Get word by PoS filter
-        """
-        # There are words without PoS tags, i. e. try
         try:
-            if sac_xml_word.attrib['pos'] \
-            in POS_FILTER[self.lang]:
-                if WITH_LEMMATA:
-                    word = sac_xml_word.attrib['lemma'].lower()
-                    if self._is_lemma_bogus(word):
-                        return sac_xml_word.text.lower()
-                    else:
-                        return sac_xml_word.attrib['lemma'].lower()
-                else:
-                    return sac_xml_word.text.lower()
-            else:
-                return None
-        except:
-            return None
+            for year, articles in self._read_books(read_book_articles):
+                self.years.append((year, len(self.articles)))
+                for article_no, article_word_list in articles:
+                    # Save article as bag-of-words (of the sentences)
+                    self.articles.append(article_word_list)
+                    text_output.write(year, article_no, article_word_list)
+        finally:
+            self.articles.close()
+            text_output.close()
+        
+        with open(self.articles_filepath + '.years', 'w') as filehdl:
+            for year, first_doc in self.years:
+                filehdl.write(str(year) + '\t' + str(first_doc) + '\n')
+        self._set_numbers()
     
-    def _is_lemma_bogus(self, lemma):
-        """ Return true if the lemma is not useful for LDA, otherwise
-            false.
-        """
+    def _read_segments(self):
+        """Iterate through all years in order to get their segments, and
+           merge the segments' dictionaries; only books not seen before 
+           are read in."""
+        self.segments_dictionary = Dictionary()
+        self.segments = []
+        self.years = [] # Year and number of its first document
+        text_output = TextOutput(self.text_output_dirpath, self.lang,
+                                 self.text_format)
         
-        for bogus_symbol in SURFACE_TRIGGERS:
-            if bogus_symbol in lemma:
-                return True
+        try:
+            for year, segment in self._read_books(read_book_segment):
+                segment_filepath, articles = segment
+                self.years.append((year, self.segments_dictionary.num_docs))
+                merge_dictionaries(self.segments_dictionary,
+                                   Dictionary.load(segment_filepath + 
+                                                   '.dict'))
+                self.segments.append(segment_filepath)
+                
+                # Only articles of books read in are written out
+                for article_no, article_word_list in articles:
+                    text_output.write(year, article_no, article_word_list)
+        finally:
+            text_output.close()
         
-        # That's the last resort
-        return False
+        # Counts of the collection before filtering
+        self.number_of_docs = self.segments_dictionary.num_docs
+        self.number_of_tokens = self.segments_dictionary.num_pos
+        self.number_of_types = len(self.segments_dictionary.token2id)
     
-    def _normalize_word(self, word_to_normalize):
-        """
-        This function helps to normalize words, because of encoding
-        issues of some LDA tools ...
-        @return: Normalized word as str type
-        """
+    def _read_books(self, read_book_function):
+        """Yield year and result of the read function given for all 
+           years (see read_books())."""
+        return read_books(self.year_range, self.lang, read_book_function,
+                          self.jobs, self.use_store, self.profiler)
         
-        # Transform umlauts to ASCII friendly form
-        word = word_to_normalize.replace(u"ä","ae").replace(u"ö","oe"). \
-            replace(u"ü","ue").replace(u"ß","ss")
-        return word
-                
     def __str__(self):
         """ Return a string which shows document number, number of
-            words and number of types.
+            words and number of types (in incremental mode taken from
+            the segments' unfiltered bag-of-words).
         """
         ret_string = ''
         art_number = 0
         
-        for article in self.articles:
+        if self.incremental:
+            counts = ((sum(int(count) for word_id, count in bow), len(bow))
+                      for segment_filepath in self.segments
+                      for bow in MmCorpus(segment_filepath + '.mm'))
+        else:
+            counts = ((len(article), len(set(article)))
+                      for article in self.articles)
+        
+        for number_of_words, number_of_types in counts:
             art_number += 1
             ret_string += 'Doc#' + str(art_number) + ': '
-            ret_string += str(len(article)) + ' [' + \
-                          str(len(set((article)))) + ']'
+            ret_string += str(number_of_words) + ' [' + \
+                          str(number_of_types) + ']'
             ret_string += '\n'
             
         return ret_string
@@ -415,15 +1937,46 @@ class ArticlesCollection:
 def print_help(program_name):
     
     print("TBTA: Text+Berg Topic Analysis tool\n")
-    print(program_name + ' <from_year[-to_year]> [lang code]')
+    print(program_name + ' <from_year[-to_year]> [lang code] [options]')
     print('Example: ' + program_name + ' 1960\n' + \
           'Example: ' + program_name + ' 1972 de\n' + \
           'Example: ' + program_name + ' 1957 de\n' + \
           'Example: ' + program_name + ' 1984 fr\n' + \
-          'Example: ' + program_name + ' 1970-1980 de\n\n' + \
+          'Example: ' + program_name + ' 1970-1980 de\n' + \
+          'Example: ' + program_name + ' 1970-1980 de --jobs 8\n' + \
+          'Example: ' + program_name + ' 1970-1985 de --incremental\n' + \
+          'Example: ' + program_name + ' 1970-1980 de --distributed 3\n' + \
+          'Example: ' + program_name + ' --cache-info\n\n' + \
           'Years allowed: 1864 to 2011\n' + \
           'Langs allowed:', DE_LANG, FR_LANG
          )
+    print('Options:\n' + \
+          '  --jobs N        Read in year books with N processes\n' + \
+          '  --incremental   Reuse dictionary and bag-of-words of\n' + \
+          '                  year books processed before\n' + \
+          '  --text-output F Plain text output format: ' + \
+          ', '.join(TEXT_OUTPUT_FORMATS) + '\n' + \
+          '  --distributed N Train LDA distributed over N local\n' + \
+          '                  workers (MODEL LdaModel only)\n' + \
+          '  --retrain       Train model even if one was saved before\n' + \
+          '                  with the same settings\n' + \
+          '  --load-model    Only print topics of the model saved\n' + \
+          '                  before with the same settings\n' + \
+          '  --online P      Train online by period P (year, decade),\n' + \
+          '                  with a checkpoint after each period\n' + \
+          '  --perplexity    Log perplexity of each period trained\n' + \
+          '                  online (one more pass over its docs)\n' + \
+          '  --load-checkpoint L\n' + \
+          '                  Only print topics of the checkpoint of\n' + \
+          '                  period L (like 1957 or 1950s)\n' + \
+          '  --store         Read year books from the columnar store\n' + \
+          '                  (convert them with tbstore.py first)\n' + \
+          '  --profile F     Write time, memory and throughput of the\n' + \
+          '                  stages to JSON file F\n' + \
+          '  --dry-run       Show which stages would be run and exit\n' + \
+          '  --cache-info    Show year books cached and exit\n' + \
+          '  --cache-purge   Remove year books cached and exit'
+         )
     sys.exit(0)
     
 def print_year_not_allowed():
@@ -441,21 +1994,76 @@ def create_caching_folders():
         makedirs(TFIDF_DIR)
     if not exists(BOWMM_DIR):
         makedirs(BOWMM_DIR)
+    if not exists(ARTICLES_DIR):
+        makedirs(ARTICLES_DIR)
+    if not exists(TOKEN_CACHE_DIR):
+        makedirs(TOKEN_CACHE_DIR)
+    if not exists(SEGMENTS_DIR):
+        makedirs(SEGMENTS_DIR)
+    if not exists(DISTRIBUTED_DIR):
+        makedirs(DISTRIBUTED_DIR)
+    if not exists(MODEL_DIR):
+        makedirs(MODEL_DIR)
+    if not exists(CHECKPOINT_DIR):
+        makedirs(CHECKPOINT_DIR)
+
+def show_token_cache():
+    """Print year books found in the token cache."""
+    
+    total_size = 0
+    for filename, year, lang, size, up_to_date in TokenCache().entries():
+        total_size += size
+        print(year + ' ' + lang + ' ' + str(size) + ' bytes ' + \
+              (up_to_date and 'current' or 'stale') + ' (' + filename + ')')
+    print('Total size: ' + str(total_size) + ' bytes')
+
+def get_options(argv):
+    """Split options (see OPTIONS) off the arguments; return options
+       found (or their defaults) and the remaining arguments."""
+    
+    options = dict(OPTIONS)
+    arguments = []
+    argv = list(argv)
+    
+    while argv:
+        arg = argv.pop(0)
+        if not arg.startswith('--'):
+            arguments.append(arg)
+            continue
+        
+        name = arg[2:].replace('-', '_')
+        if name not in OPTIONS:
+            print("Unknown option: " + arg)
+            sys.exit(3) # Error code 3: Option bogus
+        
+        default = OPTIONS[name]
+        if isinstance(default, bool):
+            options[name] = True
+            continue
+        
+        try:
+            options[name] = type(default)(argv.pop(0))
+        except (IndexError, ValueError):
+            print("Option " + arg + " needs a value of type " + \
+                  type(default).__name__ + ".")
+            sys.exit(3)
+            
+    return(options, arguments)
 
 def get_arguments(argv):
     """Check if valid input is provided and return arguments"""
     
     # At least a year must be provided
     if len(argv) < 2:
-        print_help(sys.argv[0])
+        print_help(argv[0])
         
     # Perhaps the language of the document is given
     # (That's important because of POS tags.)
     lang=DE_LANG
-    if len(sys.argv) > 2:
-        if sys.argv[2] == FR_LANG:
+    if len(argv) > 2:
+        if argv[2] == FR_LANG:
             lang = FR_LANG
-        elif sys.argv[2] == DE_LANG:
+        elif argv[2] == DE_LANG:
             pass # Already set
         else:
             print("Only languages supported:", DE_LANG, FR_LANG)
@@ -465,19 +2073,19 @@ def get_arguments(argv):
     year_range = None
     
     res = match(allowed_years_re + "(-" + allowed_years_re + ")?",
-                 sys.argv[1])
+                 argv[1])
     if res:
         # Check if first argument is fine
         try:
             # Works out if only one year provided
-            year = int(sys.argv[1])
+            year = int(argv[1])
             year_range = range(year, year+1)
             if year not in YEARS_ALLOWED:
                 print_year_not_allowed()
         except:
             # Two years with dash must have been provided
             years_extracted = [int(year) for year 
-                               in sys.argv[1].split('-')]
+                               in argv[1].split('-')]
             year_range = range(years_extracted[0],
                                years_extracted[1] + 1)
     else:
@@ -494,7 +2102,47 @@ def main():
     create_caching_folders()
     
     # Check and get arguments   
-    year_range, lang = get_arguments(sys.argv)
+    options, argv = get_options(sys.argv)
+    
+    # Cache maintenance only, no analysis
+    if options['cache_info']:
+        show_token_cache()
+        sys.exit(0)
+    if options['cache_purge']:
+        print('Removed ' + str(TokenCache().purge()) + ' cache files.')
+        sys.exit(0)
+        
+    year_range, lang = get_arguments(argv)
+    
+    if options['text_output'] not in TEXT_OUTPUT_FORMATS:
+        print("Only text output formats supported:", 
+              ', '.join(TEXT_OUTPUT_FORMATS))
+        sys.exit(3)
+    
+    # Topics of a model saved before, without reading any year book
+    if options['load_model'] or options['load_checkpoint']:
+        model_cache = ModelCache()
+        if options['load_checkpoint']:
+            model_cache = ModelCache(CHECKPOINT_DIR)
+        model = model_cache.load(collection_identifier(year_range, lang),
+                                 lang, options['load_checkpoint'])
+        if model is None:
+            print('No model saved with the current settings.')
+            sys.exit(1)
+        show_topics(model)
+        sys.exit(0)
+    
+    if options['distributed'] and MODEL != 'LdaModel':
+        print('Distributed training only supported for MODEL LdaModel.')
+        sys.exit(3)
+    
+    if options['online'] and (options['online'] not in ONLINE_PERIODS or
+                              MODEL not in ['LdaModel', 'LdaMulticore'] or
+                              options['distributed']):
+        print('Online training only supported by period ' + 
+              ' or '.join(ONLINE_PERIODS) + ', for MODEL LdaModel or ' +
+              'LdaMulticore and not distributed.')
+        sys.exit(3)
     
     # Construct string
     text_output_pos_string = 'NONE'
@@ -517,8 +2165,62 @@ def main():
     
     articles_collection = ArticlesCollection(year_range, 
                                              text_output_dirpath,
-                                             lang)
-    articles_collection.show_lda()
+                                             lang,
+                                             jobs=options['jobs'],
+                                             incremental=\
+                                                 options['incremental'],
+                                             text_format=\
+                                                 options['text_output'],
+                                             use_store=options['store'])
+    
+    if options['dry_run']:
+        # Same condition as in show_lda(); online training always runs
+        model_cached = not options['online'] and USE_MODEL_CACHE and \
+                       not options['retrain'] and \
+                       ModelCache().exists(articles_collection.identifier,
+                                           lang)
+        
+        # The collection is only needed where the model is trained
+        outputs = []
+        if not model_cached and USE_TFIDF:
+            outputs = ['number_of_docs', 'years', 'dictionary',
+                       'tfidf_corpus']
+        elif not model_cached:
+            outputs = ['number_of_docs', 'years', 'dictionary',
+                       'bow_corpus']
+        articles_collection.show_stages(outputs)
+        if model_cached:
+            print('Stage model: up to date, skipped')
+        else:
+            print('Stage model: to be run')
+        sys.exit(0)
+    
+    # Profile written also where the run fails (stages are executed
+    # while the model is made, see ArticlesCollection)
+    try:
+        if options['online']:
+            show_topics(articles_collection.train_online(
+                            options['online'], options['retrain'],
+                            options['perplexity']))
+        # No cluster needed where a saved model is loaded
+        elif not options['distributed'] or (USE_MODEL_CACHE and 
+             not options['retrain'] and ModelCache().exists(
+                 articles_collection.identifier, lang)):
+            articles_collection.show_lda(retrain=options['retrain'])
+        else:
+            # Local cluster is shut down in any case (also on Ctrl-C)
+            cluster = LdaCluster(options['distributed'])
+            try:
+                cluster.start()
+                articles_collection.show_lda(cluster, options['retrain'])
+            except RuntimeError as error:
+                print('Distributed LDA failed: ' + str(error))
+                sys.exit(1)
+            finally:
+                cluster.stop()
+    finally:
+        if options['profile']:
+            articles_collection.write_profile(options['profile'])
     
 if __name__ == '__main__':
 	main()